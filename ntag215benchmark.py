@@ -0,0 +1,274 @@
+"""
+ntag215benchmark.py
+Throughput benchmarks for ntag215converter
+
+Generates synthetic NTAG215 dumps (full 540 byte, truncated and oversize) and .nfc files,
+times every conversion stage and a whole directory conversion, and writes the results as JSON.
+
+Execute with python ntag215benchmark.py -h to see options
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import ntag215converter
+
+# name -> dump size in bytes
+DUMP_SIZES = {
+    "full": 540,
+    "truncated": 300,
+    "oversize": 572,
+}
+
+
+def make_dumps(count: int, seed: int = 0) -> Dict[str, List[bytes]]:
+    """
+    Generates random dumps of every size in DUMP_SIZES
+    :param count: Number of dumps per size
+    :param seed: Seed for the random generator, so runs are comparable
+    :return: size name -> list of dumps
+    """
+    rng = random.Random(seed)
+    return {name: [rng.randbytes(size) for _ in range(count)] for name, size in DUMP_SIZES.items()}
+
+
+def percentiles(samples_ns: List[int]) -> Dict[str, float]:
+    """
+    :param samples_ns: Latencies in nanoseconds
+    :return: Mean, p50, p90, p99 and max latency in microseconds
+    """
+    ordered = sorted(samples_ns)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] / 1000
+
+    return {
+        "mean_us": sum(ordered) / len(ordered) / 1000,
+        "p50_us": rank(0.50),
+        "p90_us": rank(0.90),
+        "p99_us": rank(0.99),
+        "max_us": ordered[-1] / 1000,
+    }
+
+
+def time_stage(func: Callable, inputs: List, input_bytes: int) -> dict:
+    """
+    Calls func once per input and records each call's latency
+    :param func: The stage to time, taking a single argument
+    :param inputs: Arguments to call func with
+    :param input_bytes: Total size of all inputs, for the MB/sec figure
+    :return: Call count, calls/sec, MB/sec and latency percentiles
+    """
+    samples = []
+    started = time.perf_counter_ns()
+    for item in inputs:
+        call_started = time.perf_counter_ns()
+        func(item)
+        samples.append(time.perf_counter_ns() - call_started)
+    elapsed = (time.perf_counter_ns() - started) / 1e9
+    return {
+        "calls": len(inputs),
+        "calls_per_sec": len(inputs) / elapsed,
+        "mb_per_sec": input_bytes / elapsed / 1e6,
+        **percentiles(samples),
+    }
+
+
+def bench_stages(dumps: Dict[str, List[bytes]], work_dir: str) -> dict:
+    """
+    Times convert(), assemble_code(), calculate_password() and save_ntag215_v2_with_pwd()
+    :param dumps: Output of make_dumps
+    :param work_dir: Scratch directory for the .nfc files
+    :return: stage name -> results of time_stage
+    """
+    results = {}
+    for name, samples in dumps.items():
+        total = sum(map(len, samples))
+        results[f"convert[{name}]"] = time_stage(ntag215converter.convert, samples, total)
+        results[f"assemble_code[{name}]"] = time_stage(ntag215converter.assemble_code, samples, total)
+
+    full = dumps["full"]
+    uids = [bytes.fromhex(ntag215converter.get_uid(dump)) for dump in full]
+    results["calculate_password"] = time_stage(ntag215converter.calculate_password, uids, 7 * len(uids))
+
+    nfc_paths = []
+    for i, dump in enumerate(full):
+        nfc_path = os.path.join(work_dir, f"stage_{i}.nfc")
+        with open(nfc_path, "wt") as f:
+            f.write(ntag215converter.assemble_code(dump))
+        nfc_paths.append(nfc_path)
+    results["save_ntag215_v2_with_pwd"] = time_stage(
+        lambda path: ntag215converter.save_ntag215_v2_with_pwd(path, f"{path}.out"),
+        nfc_paths,
+        sum(os.path.getsize(path) for path in nfc_paths),
+    )
+    return results
+
+
+def bench_allocations(dumps: Dict[str, List[bytes]]) -> dict:
+    """
+    Measures the memory every way of rendering a full dump churns through, with tracemalloc:
+    the peak of short-lived allocations while rendering one file, and the blocks still allocated afterwards.
+    CPython keeps no count of allocations made, only of live ones, so the peak stands in for the churn
+    :param dumps: Output of make_dumps
+    :return: renderer name -> peak bytes and leftover blocks per file
+    """
+    render_buffer = ntag215converter.get_render_buffer()
+    renderers = {
+        "assemble_code": ntag215converter.assemble_code,
+        "render_document": ntag215converter.render_document,
+        "RenderBuffer.render": render_buffer.render,
+    }
+    full = dumps["full"]
+    results = {}
+    tracemalloc.start()
+    try:
+        for name, render in renderers.items():
+            # warm up, so lazily created objects aren't counted
+            render(full[0])
+            peaks = []
+            before = tracemalloc.take_snapshot()
+            for dump in full:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                render(dump)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            after = tracemalloc.take_snapshot()
+            leftover = sum(stat.count_diff for stat in after.compare_to(before, "lineno"))
+            results[name] = {
+                "files": len(full),
+                "peak_bytes_per_file": sum(peaks) / len(peaks),
+                "leftover_blocks_per_file": leftover / len(full),
+            }
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def bench_directory(dumps: Dict[str, List[bytes]], work_dir: str, jobs: int) -> dict:
+    """
+    Times process() over a directory holding every dump as a .bin file plus a .nfc file per full dump
+    :param dumps: Output of make_dumps
+    :param work_dir: Scratch directory for the input and output trees
+    :param jobs: Worker processes for process()
+    :return: File count, files/sec and MB/sec
+    """
+    input_dir = os.path.join(work_dir, "input")
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(input_dir)
+    total_bytes = 0
+    files = 0
+    for name, samples in dumps.items():
+        for i, dump in enumerate(samples):
+            with open(os.path.join(input_dir, f"{name}_{i}.bin"), "wb") as f:
+                f.write(dump)
+            total_bytes += len(dump)
+            files += 1
+    for i, dump in enumerate(dumps["full"]):
+        document = ntag215converter.assemble_code(dump).encode()
+        with open(os.path.join(input_dir, f"full_{i}.nfc"), "wb") as f:
+            f.write(document)
+        total_bytes += len(document)
+        files += 1
+
+    os.makedirs(output_dir)
+    started = time.perf_counter()
+    summary = ntag215converter.process(input_dir, output_dir, False, jobs)
+    elapsed = time.perf_counter() - started
+    return {
+        "files": files,
+        "jobs": jobs,
+        "failed": len(summary.failed),
+        "seconds": elapsed,
+        "files_per_sec": files / elapsed,
+        "mb_per_sec": total_bytes / elapsed / 1e6,
+    }
+
+
+def run(count: int, files: int, jobs: int, seed: int = 0) -> dict:
+    """
+    Runs every benchmark in a temporary directory
+    :param count: Dumps per size for the per-stage benchmarks
+    :param files: Dumps per size for the directory benchmark
+    :param jobs: Worker processes for the directory benchmark
+    :param seed: Seed for the synthetic dumps
+    :return: Everything that gets written to the JSON report
+    """
+    work_dir = tempfile.mkdtemp(prefix="ntag215bench")
+    try:
+        stages = bench_stages(make_dumps(count, seed), work_dir)
+        allocations = bench_allocations(make_dumps(count, seed))
+        directory = bench_directory(make_dumps(files, seed + 1), os.path.join(work_dir, "tree"), jobs)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "count": count,
+        "seed": seed,
+        "stages": stages,
+        "allocations": allocations,
+        "directory": directory,
+    }
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o",
+        "--output-path",
+        default="ntag215_benchmark.json",
+        help="JSON file to write the results to.",
+    )
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=1000,
+        help="Synthetic dumps per size (full, truncated, oversize) for the per-stage benchmarks.",
+    )
+    parser.add_argument(
+        "-f",
+        "--files",
+        type=int,
+        default=300,
+        help="Synthetic dumps per size for the end-to-end directory benchmark.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for the end-to-end directory benchmark.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic dumps.")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    results = run(args.count, args.files, args.jobs, args.seed)
+    with open(args.output_path, "wt") as f:
+        json.dump(results, f, indent=2)
+
+    for stage, result in results["stages"].items():
+        print(f"{stage:40} {result['calls_per_sec']:12.0f}/s  p50 {result['p50_us']:8.1f}us  p99 {result['p99_us']:8.1f}us")
+    for renderer, result in results["allocations"].items():
+        print(f"{renderer:40} {result['peak_bytes_per_file']:12.0f} peak bytes/file")
+    directory = results["directory"]
+    print(
+        f"{'directory':40} {directory['files_per_sec']:12.0f} files/s  {directory['mb_per_sec']:.2f} MB/s  "
+        f"{directory['failed']} failed"
+    )
+    print(f"Results written to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,282 @@ Original Code by Turbospok
 Execute with python ntag215converter -h to see options
 """
 import argparse
+import asyncio
+import base64
+import binascii
+import collections
+import concurrent.futures
+import contextlib
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import io
+import json
 import logging
+import mmap
 import os
 import pathlib
-from typing import Tuple
+import posixpath
+import queue
+import select
+import shutil
+import signal
+import socketserver
+import sqlite3
+import stat
+import string
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RunStats:
+    """
+    Accumulates wall time, CPU time, call counts and byte counts per conversion stage
+    (walk, read, convert, assemble, write). Enable it with set_stats().
+    In --jobs mode the worker processes' stages are summed, so stage times can add up to more than the run took.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        # stages can be timed from several threads at once in pipeline mode
+        self.lock = threading.Lock()
+
+    def _entry(self, name: str) -> dict:
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "bytes": 0}
+        return entry
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry = self._entry(name)
+                entry["calls"] += 1
+                entry["wall_s"] += time.perf_counter() - wall
+                entry["cpu_s"] += time.process_time() - cpu
+
+    def add_bytes(self, name: str, size: int):
+        with self.lock:
+            self._entry(name)["bytes"] += size
+
+    def merge(self, stages: dict):
+        """
+        :param stages: Another RunStats' stages, e.g. shipped back from a worker process
+        """
+        for name, other in stages.items():
+            entry = self._entry(name)
+            for key, value in other.items():
+                entry[key] += value
+
+    def drain(self) -> dict:
+        """
+        :return: The stages collected so far, which are then reset
+        """
+        stages, self.stages = self.stages, {}
+        return stages
+
+    def to_dict(self) -> dict:
+        return {
+            "elapsed_s": time.perf_counter() - self.started,
+            "files": self.stages.get("read", {}).get("calls", 0),
+            "stages": self.stages,
+        }
+
+
+_stats: Optional[RunStats] = None
+
+
+def set_stats(stats: Optional[RunStats]):
+    """
+    Turns per-stage instrumentation on (with a RunStats to collect into) or off (with None)
+    """
+    global _stats
+    _stats = stats
+
+
+def _stage(name: str):
+    """
+    :return: A context manager timing a stage into the active RunStats, if any
+    """
+    if _stats is None:
+        return contextlib.nullcontext()
+    return _stats.stage(name)
+
+
+def _count_bytes(name: str, size: int):
+    if _stats is not None:
+        _stats.add_bytes(name, size)
+
+
+def _timed(iterable: Iterable, name: str) -> Iterator:
+    """
+    Times every step of an iterator as a stage, e.g. the directory walk
+    """
+    iterator = iter(iterable)
+    while True:
+        with _stage(name):
+            item = next(iterator, _timed)
+        if item is _timed:
+            return
+        yield item
+
+
+# how hard writes try to reach the disk: "none" leaves it to the OS, "batch" fsyncs every N files at once,
+# "fsync" fsyncs every file (and its directory) before moving on
+DURABILITY_MODES = ("none", "batch", "fsync")
+
+# on Windows FlushFileBuffers needs write access, and directories can't be fsynced at all
+_FSYNC_FLAGS = os.O_RDWR if os.name == "nt" else os.O_RDONLY
+
+
+def _fsync_directory(directory: str):
+    """
+    Makes renames within directory durable
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sync_paths(paths: List[str]):
+    """
+    fsyncs every file, then every directory holding them
+    """
+    with _stage("sync"):
+        for path in paths:
+            try:
+                fd = os.open(path, _FSYNC_FLAGS)
+            except FileNotFoundError:
+                # overwritten or removed since, nothing left to sync
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for directory in sorted({os.path.dirname(path) for path in paths}):
+            _fsync_directory(directory)
+
+
+class Durability:
+    """
+    Tracks the files atomic_write has committed and fsyncs them as the durability mode asks for
+    """
+
+    def __init__(self, mode: str = "none", batch: int = 1000):
+        """
+        :param mode: One of DURABILITY_MODES
+        :param batch: With "batch", fsync once this many files are pending; 0 never syncs on its own,
+                      leaving the pending files to drain(), e.g. to ship them from a worker process to its parent
+        """
+        self.mode = mode
+        self.batch = batch
+        self.pending: List[str] = []
+        self.lock = threading.Lock()
+
+    def committed(self, path: str):
+        """
+        Called once path has been renamed into place
+        """
+        if self.mode == "fsync":
+            _fsync_directory(os.path.dirname(path))
+        elif self.mode == "batch":
+            with self.lock:
+                self.pending.append(path)
+                if not self.batch or len(self.pending) < self.batch:
+                    return
+                paths, self.pending = self.pending, []
+            _sync_paths(paths)
+
+    def drain(self) -> List[str]:
+        """
+        :return: The files committed but not synced yet, which are no longer tracked
+        """
+        with self.lock:
+            paths, self.pending = self.pending, []
+        return paths
+
+    def sync(self):
+        """
+        fsyncs every pending file, e.g. at the end of a run
+        """
+        paths = self.drain()
+        if paths:
+            _sync_paths(paths)
+
+
+_durability = Durability()
+
+
+def set_durability(durability: Durability):
+    """
+    Picks how hard every following write tries to reach the disk
+    """
+    global _durability
+    _durability = durability
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, sync: bool = False) -> Iterator[int]:
+    """
+    Writes a file into a temporary file next to it, renamed over path only once complete, so a crashing run
+    leaves the old file or the new one, never a truncated one.
+    Surviving a power cut as well takes the temporary file's data reaching the disk before the rename does,
+    which only the "fsync" durability mode (or sync) guarantees; otherwise the file can come back empty
+    :param path: The file to (over)write
+    :param sync: fsync the new contents before replacing path whatever the durability mode, e.g. for the only copy
+                 of a card converted in place
+    :return: A raw file descriptor to write the contents to
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        try:
+            yield fd
+            if sync or _durability.mode == "fsync":
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        # an overwritten file keeps its permissions, as it would have being written to directly
+        with contextlib.suppress(FileNotFoundError):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+    _durability.committed(path)
+
+
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = "wt", sync: bool = False) -> Iterator[io.IOBase]:
+    """
+    atomic_write, as a file object
+    :param path: The file to (over)write
+    :param mode: The mode to open it with, e.g. "wt" or "wb"
+    :param sync: See atomic_write
+    """
+    with atomic_write(path, sync) as fd, open(fd, mode, closefd=False) as f:
+        yield f
 
 
 def write_output(name: str, assemble: str, out_dir: str):
@@ -21,8 +293,80 @@ def write_output(name: str, assemble: str, out_dir: str):
     :param assemble: The converted flipper-compatible contents
     :param out_dir: The directory to place Foo.nfc in
     """
-    with open(os.path.join(out_dir, f"{name}.nfc"), "wt") as f:
+    with _stage("write"), atomic_open(os.path.join(out_dir, f"{name}.nfc")) as f:
         f.write(assemble)
+    _count_bytes("write", len(assemble))
+
+
+def write_document(path: str, buffers: List[bytes]):
+    """
+    Atomically writes a rendered document (e.g. from render_document) with a single gathering os.writev() call where
+    the platform has one, bypassing the buffered text layer. Lines end in "\n" on every platform, as on the Flipper itself
+    :param path: The file to (over)write
+    :param buffers: The document's ASCII chunks, in order
+    """
+    size = sum(map(len, buffers))
+    with _stage("write"), atomic_write(path) as fd:
+        written = os.writev(fd, buffers) if hasattr(os, "writev") else 0
+        if written < size:
+            # no writev (e.g. Windows) or a short write: write out whatever is left
+            remaining = memoryview(b"".join(buffers))[written:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining) :]
+    _count_bytes("write", size)
+
+
+# NTAG215 holds 540 bytes (135 pages); the first 133 pages come from the dump,
+# pages 133 (PWD) and 134 (PACK + RFUI) are generated
+DATA_PAGES = 133
+DATA_SIZE = DATA_PAGES * 4
+TOTAL_PAGES = 135
+
+# where the 7 UID bytes sit in a dump: bytes 0-2, then (after the BCC0 check byte) bytes 4-7
+UID_OFFSETS = (0, 1, 2, 4, 5, 6, 7)
+
+# PACK (password acknowledge) written alongside every generated PWD
+PACK = b"\x80\x80"
+
+# uppercase hex for every byte value, so rendering never formats bytes one at a time
+HEX_TABLE = tuple(f"{byte:02X}" for byte in range(256))
+# the same as ASCII bytes, for rendering straight to bytes
+HEX_BYTES = tuple(hex_str.encode() for hex_str in HEX_TABLE)
+
+# every data page line, with a slot per byte
+_PAGES_TEMPLATE = "\n".join(f"Page {page}: %s %s %s %s" for page in range(DATA_PAGES))
+_PAGES_BYTE_TEMPLATE = _PAGES_TEMPLATE.encode()
+
+
+def as_view(contents) -> memoryview:
+    """
+    :param contents: bytes, bytearray, mmap or any other buffer
+    :return: A flat byte-wise memoryview over contents, without copying them
+    """
+    view = memoryview(contents)
+    if view.format != "B" or view.ndim != 1:
+        view = view.cast("B")
+    return view
+
+
+@contextlib.contextmanager
+def map_file(path: str) -> Iterator[memoryview]:
+    """
+    Memory-maps a file read-only, for dumps too big or too many to read into memory, e.g. concatenated containers
+    :param path: The file to map
+    :return: A memoryview over the whole file, only valid inside the with block
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # empty files can't be mapped
+            yield memoryview(b"")
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
 
 
 def convert(contents: bytes) -> Tuple[str, int]:
@@ -32,85 +376,81 @@ def convert(contents: bytes) -> Tuple[str, int]:
     Each "Page" is 4 bytes hex, notated like:
         Page 0: DE AD BE EF
 
-    To process, we grab one byte at a time, turn it into a hex string, and store it in `page`.
-    When page is "full" (has 4 bytes in it), we flush it to the buffer.
-
-    When all's said and done, buffer contains text ready for writing to the end of a .nfc file.
+    The first 133 pages of the dump are zero-padded (or truncated) to exactly 532 bytes, every byte
+    is looked up in HEX_TABLE and the whole block is rendered through a single precompiled template.
 
-    Also tracks and returns running page number, since that's also needed.
     There should be exacly 135 pages for the .nfc not to fail on flipper,
     due to NTAG215 beeing of 540 byte (135 pages) capacity.
-    :param contents: byte array we're reading, from a .bin file
-    :return: The full string of Pages, suitable for writing to a file
-    """
-    buffer = []
-    page_count = 0
-
-    page = []
-    for i in range(len(contents)):
-        if page_count > 132:
-            logging.debug(f"We have enough pages, breaking")
-            break
-
-        byte = contents[i : i + 1].hex()
-        page.append(byte)
-
-        if len(page) == 4:
-            buffer.append(f"Page {page_count}: {' '.join(page).upper()}")
-            page = []
-            page_count += 1
-
-    # we may have an unfilled page. This needs to be filled out and appended
-    if len(page) > 0:
-        logging.debug(f"We have an unfilled final page: {page} with length {len(page)}")
-        # pad with zeroes
-        for i in range(len(page) - 1, 3):
-            page.append("00")
-        buffer.append(f"Page {page_count}: {' '.join(page).upper()}")
-        page_count += 1
-
-    # we are missing a few pages, padding with zeroes
-    if page_count < 133:
-        logging.debug(f"We are missing {133-page_count} pages, padding with zeroes")
-        while page_count < 133:
-            buffer.append(f"Page {page_count}: 00 00 00 00")
-            page_count += 1
-
-    # now add pages 133 (PWD) and 134 (PACK + RFUI / Reserved for future use)
-    pwd_hex = ' '.join('{:02X}'.format(byte) for byte in get_pwd(contents))
-    # PWD
-    buffer.append(f"Page {page_count}: {pwd_hex}")
-    page_count += 1
-    # PACK (0x80 0x80) + RFUI (0x00 0x00)
-    buffer.append(f"Page {page_count}: 80 80 00 00")
-    page_count += 1
-
-    return "\n".join(buffer), page_count
+    :param contents: byte array we're reading, from a .bin file. Any buffer works, e.g. a memoryview into a larger
+                     mmap; it is only ever read through a view, never copied (short dumps aside, which get padded)
+    :return: The full string of Pages, suitable for writing to a file, and the page count
+    """
+    pages = _PAGES_TEMPLATE % tuple(map(HEX_TABLE.__getitem__, _page_data(contents)))
+
+    # now add pages 133 (PWD) and 134 (PACK (0x80 0x80) + RFUI / Reserved for future use (0x00 0x00))
+    pwd_hex = " ".join(map(HEX_TABLE.__getitem__, get_pwd(contents)))
+    return f"{pages}\nPage 133: {pwd_hex}\nPage 134: 80 80 00 00", TOTAL_PAGES
+
+
+def convert_to_bytes(contents: bytes) -> Tuple[List[bytes], int]:
+    """
+    convert(), rendering straight to ASCII bytes instead of going through a str
+    :param contents: byte array we're reading, from a .bin file, or any other buffer
+    :return: The Pages as a list of buffers, in order, and the page count
+    """
+    pages = _PAGES_BYTE_TEMPLATE % tuple(map(HEX_BYTES.__getitem__, _page_data(contents)))
+    pwd_hex = b" ".join(map(HEX_BYTES.__getitem__, get_pwd(contents)))
+    return [pages, b"\nPage 133: ", pwd_hex, b"\nPage 134: 80 80 00 00"], TOTAL_PAGES
+
+
+def _page_data(contents: bytes) -> memoryview:
+    """
+    :param contents: byte array we're reading, or any other buffer
+    :return: The data pages' 532 bytes - a view into contents, or a zero-padded copy of a short dump
+    """
+    data = as_view(contents)[:DATA_SIZE]
+    if len(data) < DATA_SIZE:
+        logging.debug(f"We are missing {DATA_SIZE - len(data)} bytes, padding with zeroes")
+        data = memoryview(bytes(data).ljust(DATA_SIZE, b"\x00"))
+    return data
 
 
 def get_uid(contents: bytes) -> str:
     """
     the UID appears to be made up of the first 3 bytes, a byte is skipped, and then the next 4 bytes
-    :param contents: The bytes object we're operating on
+    :param contents: The bytes object (or any other buffer) we're operating on
     :return: something like `23 20 41 6D 69 69 62 6F`
     """
-    page = []
-    for i in range(3):
-        byte = contents[i : i + 1].hex()
-        page.append(byte)
-    for i in range(4, 8):
-        byte = contents[i : i + 1].hex()
-        page.append(byte)
+    size = len(contents)
+    # bytes missing from a short dump come out as empty strings, as they always have
+    return " ".join(HEX_TABLE[contents[i]] if i < size else "" for i in UID_OFFSETS)
 
-    return " ".join(page).upper()
+def get_uid_hex_bytes(contents: bytes) -> bytes:
+    """get_uid(), as ASCII bytes"""
+    size = len(contents)
+    return b" ".join(HEX_BYTES[contents[i]] if i < size else b"" for i in UID_OFFSETS)
 
 def get_pwd(contents: bytes) -> bytes:
-    """Return the PWD associated to the content UID"""
-    uid = bytes.fromhex(get_uid(contents))
-    #pwd = bytearray(4)    
-    pwd = calculate_password(uid)
+    """Return the PWD associated to the content UID, reading the UID bytes straight out of contents"""
+    if len(contents) < 8:
+        # not a full UID, let calculate_password complain about it
+        return bytes(calculate_password(bytes.fromhex(get_uid(contents))))
+
+    pwd = bytes(_dump_pwd(contents))
+    logging.debug(f"Password {''.join(' {:02X}'.format(x) for x in pwd) } generated")
+    return pwd
 
-    return bytes(pwd)
+def _dump_pwd(contents: bytes) -> Tuple[int, int, int, int]:
+    """
+    calculate_password with uid[i] read from contents[UID_OFFSETS[i]], for dumps with a whole UID
+    :return: The 4 PWD bytes, as ints
+    """
+    return (
+        contents[1] ^ contents[4] ^ 0xAA,
+        contents[2] ^ contents[5] ^ 0x55,
+        contents[4] ^ contents[6] ^ 0xAA,
+        contents[5] ^ contents[7] ^ 0x55,
+    )
 
 def calculate_password(uid : bytearray):
     pwd = []
@@ -124,21 +464,61 @@ def calculate_password(uid : bytearray):
         logging.error("Can not generate password! UID length not equal to 7")
     return pwd
 
-def assemble_code(contents: {hex}) -> str:
+def _xor_columns(a: bytes, b: bytes, key: int) -> bytes:
     """
-    Convert from .bin files to Flipper text-like .nfc files
-    
-    :param contents: File contents upon which .hex() can be called
-    :return: A string to be written to a file
+    XOR two equally long byte columns and a constant key byte in one go, using Python's big integers
+    """
+    n = len(a)
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big") ^ int.from_bytes(bytes([key]) * n, "big")).to_bytes(
+        n, "big"
+    )
+
+def calculate_passwords_batch(uids: Union["numpy.ndarray", bytes, Iterable[bytes]]):
     """
-    conversion, page_count = convert(contents)
+    Derive PWD and PACK for many 7-byte UIDs in a single vectorized pass
+    :param uids: An N x 7 NumPy array, or N UIDs packed back to back in a bytes-like object,
+                 or an iterable of 7-byte UIDs
+    :return: (pwds, packs) - N x 4 and N x 2 uint8 arrays for NumPy input,
+             otherwise bytes holding 4 resp. 2 bytes per UID, in input order
+    """
+    if numpy is not None and isinstance(uids, numpy.ndarray):
+        if uids.ndim != 2 or uids.shape[1] != 7:
+            raise ValueError(f"Expected an N x 7 array of UIDs, got shape {uids.shape}")
+        uids = uids.astype(numpy.uint8, copy=False)
+        pwds = numpy.empty((len(uids), 4), dtype=numpy.uint8)
+        pwds[:, 0] = uids[:, 1] ^ uids[:, 3] ^ 0xAA
+        pwds[:, 1] = uids[:, 2] ^ uids[:, 4] ^ 0x55
+        pwds[:, 2] = uids[:, 3] ^ uids[:, 5] ^ 0xAA
+        pwds[:, 3] = uids[:, 4] ^ uids[:, 6] ^ 0x55
+        packs = numpy.tile(numpy.frombuffer(PACK, dtype=numpy.uint8), (len(uids), 1))
+        return pwds, packs
+
+    if isinstance(uids, (bytes, bytearray, memoryview)):
+        uids = bytes(uids)
+    else:
+        uids = list(uids)
+        for index, uid in enumerate(uids):
+            if len(uid) != 7:
+                raise ValueError(f"Expected UIDs of 7 bytes each, UID {index} has {len(uid)} bytes")
+        uids = b"".join(uids)
+    if len(uids) % 7:
+        raise ValueError(f"Expected UIDs of 7 bytes each, got {len(uids)} bytes")
+    count = len(uids) // 7
+    # split into one column per UID byte, then compute each PWD byte column with a single XOR
+    columns = [uids[i::7] for i in range(7)]
+    pwds = bytearray(4 * count)
+    pwds[0::4] = _xor_columns(columns[1], columns[3], 0xAA)
+    pwds[1::4] = _xor_columns(columns[2], columns[4], 0x55)
+    pwds[2::4] = _xor_columns(columns[3], columns[5], 0xAA)
+    pwds[3::4] = _xor_columns(columns[4], columns[6], 0x55)
+    return bytes(pwds), PACK * count
 
-    return f"""Filetype: Flipper NFC device
+DOCUMENT_TEMPLATE = """Filetype: Flipper NFC device
 Version: 2
 # Nfc device type can be UID, Mifare Ultralight, Bank card
 Device type: NTAG215
 # UID, ATQA and SAK are common for all formats
-UID: {get_uid(contents)}
+UID: {uid}
 ATQA: 44 00
 SAK: 00
 # Mifare Ultralight specific data
@@ -151,9 +531,137 @@ Tearing 1: 00
 Counter 2: 0
 Tearing 2: 00
 Pages total: {page_count}
-{conversion}
+{pages}
 """
 
+def compile_template(template: str) -> Tuple[list, dict]:
+    """
+    Splits a str.format template into its static chunks and slots, once, so rendering is a list fill and a join
+    :param template: The template, with plain {name} fields
+    :return: (parts, with None where each slot goes; slot name -> its index in parts)
+    """
+    parts = []
+    slots = {}
+    for literal, field, _, _ in string.Formatter().parse(template):
+        if literal:
+            parts.append(literal)
+        if field is not None:
+            slots[field] = len(parts)
+            parts.append(None)
+    return parts, slots
+
+_DOCUMENT_PARTS, _DOCUMENT_SLOTS = compile_template(DOCUMENT_TEMPLATE)
+_DOCUMENT_BYTE_PARTS = [None if part is None else part.encode() for part in _DOCUMENT_PARTS]
+
+def render_document(contents: bytes) -> List[bytes]:
+    """
+    Convert from .bin files to Flipper .nfc files as a list of ASCII buffers - the template's static chunks
+    with the UID, page count and pages in between - ready for b"".join() or os.writev()
+    :param contents: File contents, as bytes or any other buffer
+    :return: The buffers making up the file, in order
+    """
+    with _stage("convert"):
+        conversion, page_count = convert_to_bytes(contents)
+
+    with _stage("assemble"):
+        parts = _DOCUMENT_BYTE_PARTS.copy()
+        parts[_DOCUMENT_SLOTS["uid"]] = get_uid_hex_bytes(contents)
+        parts[_DOCUMENT_SLOTS["page_count"]] = b"%d" % page_count
+        pages = _DOCUMENT_SLOTS["pages"]
+        parts[pages : pages + 1] = conversion
+        return parts
+
+def assemble_code(contents: {hex}) -> str:
+    """
+    Convert from .bin files to Flipper text-like .nfc files, by filling the precompiled DOCUMENT_TEMPLATE
+    
+    :param contents: File contents upon which .hex() can be called
+    :return: A string to be written to a file
+    """
+    with _stage("convert"):
+        conversion, page_count = convert(contents)
+
+    with _stage("assemble"):
+        parts = _DOCUMENT_PARTS.copy()
+        parts[_DOCUMENT_SLOTS["uid"]] = get_uid(contents)
+        parts[_DOCUMENT_SLOTS["page_count"]] = str(page_count)
+        parts[_DOCUMENT_SLOTS["pages"]] = conversion
+        return "".join(parts)
+
+
+class RenderBuffer:
+    """
+    A preallocated, fully laid out .nfc document that every render overwrites in place, so converting a dump
+    allocates a few dozen short-lived objects instead of hundreds of strings and lists.
+    Each worker (process or thread) owns one - see get_render_buffer()
+    """
+
+    __slots__ = ("buffer", "view", "_uid", "_pwd", "_groups")
+
+    # data pages whose lines are equally long: "Page 0: " ... "Page 132: "
+    PAGE_GROUPS = ((0, 10), (10, 100), (100, DATA_PAGES))
+    HEX_DIGITS = b"0123456789ABCDEF"
+
+    def __init__(self):
+        # any dump with a whole UID lays the document out the same way, only the hex digits differ
+        document = b"".join(render_document(bytes(DATA_SIZE)))
+        self.buffer = bytearray(document)
+        self.view = memoryview(self.buffer)
+        uid_start = document.index(b"\nUID: ") + len(b"\nUID: ")
+        self._uid = tuple(zip(range(uid_start, uid_start + 3 * len(UID_OFFSETS), 3), UID_OFFSETS))
+        pwd_start = document.index(b"\nPage 133: ") + len(b"\nPage 133: ")
+        self._pwd = tuple(range(pwd_start, pwd_start + 12, 3))
+        self._groups = []
+        for first, last in self.PAGE_GROUPS:
+            prefix = b"Page %d: " % first
+            start = document.index(b"\n" + prefix) + 1 + len(prefix)
+            # a line is the prefix, 4 hex bytes with a space between each and the newline
+            self._groups.append((first, last, start, len(prefix) + 12))
+
+    def render(self, contents: bytes) -> memoryview:
+        """
+        Renders a dump into the buffer, exactly as render_document() would
+        :param contents: File contents, as bytes or any other buffer
+        :return: A view of the whole document, only valid until the next render
+        """
+        if len(contents) < 8:
+            # a partial UID changes the document's layout; such dumps are broken anyway
+            return memoryview(b"".join(render_document(contents)))
+
+        with _stage("convert"):
+            hexed = binascii.hexlify(_page_data(contents)).upper()
+            pwd = _dump_pwd(contents)
+
+        with _stage("assemble"):
+            buffer = self.buffer
+            # each hex digit column of a group of equally long page lines is one strided slice assignment
+            for first, last, start, stride in self._groups:
+                end = start + stride * (last - first)
+                for digit in range(8):
+                    position = start + 3 * (digit >> 1) + (digit & 1)
+                    buffer[position:end:stride] = hexed[8 * first + digit : 8 * last : 8]
+
+            digits = self.HEX_DIGITS
+            for position, offset in self._uid:
+                byte = contents[offset]
+                buffer[position] = digits[byte >> 4]
+                buffer[position + 1] = digits[byte & 15]
+            for position, byte in zip(self._pwd, pwd):
+                buffer[position] = digits[byte >> 4]
+                buffer[position + 1] = digits[byte & 15]
+            return self.view
+
+_render_buffers = threading.local()
+
+def get_render_buffer() -> RenderBuffer:
+    """
+    :return: The calling thread's RenderBuffer, created on first use
+    """
+    render_buffer = getattr(_render_buffers, "buffer", None)
+    if render_buffer is None:
+        render_buffer = _render_buffers.buffer = RenderBuffer()
+    return render_buffer
+
 def get_string_containing(lines, sub_str):
     '''
     Searches a string by pattern
@@ -213,139 +721,2228 @@ def save_pack_to_page(lines, pack):
     '''
     replace_page_data(lines, "Page 134:", [pack[0], pack[1], 0, 0])
 
+class NfcDocument:
+    """
+    A Flipper .nfc file parsed once into an index of its header fields and pages,
+    so any number of page reads and writes cost O(1) each instead of a scan over every line
+    """
+
+    def __init__(self, lines: List[str]):
+        """
+        :param lines: .nfc file content read by lines. Edits are made to this list in place
+        """
+        self.lines = lines
+        self.fields = {}
+        self.pages = {}
+        for i, line in enumerate(lines):
+            if line.startswith("#"):
+                continue
+            key, sep, _ = line.partition(":")
+            if not sep:
+                continue
+            if key.startswith("Page ") and key[5:].isdigit():
+                self.pages[int(key[5:])] = i
+            else:
+                self.fields.setdefault(key, i)
+
+    @classmethod
+    def from_text(cls, text: str) -> "NfcDocument":
+        return cls(text.splitlines(keepends=True))
+
+    @classmethod
+    def read(cls, path: str) -> "NfcDocument":
+        with open(path, "r") as file:
+            return cls(file.readlines())
+
+    def get_field(self, name: str) -> str:
+        """
+        :param name: Header field name, e.g. `Device type`
+        :return: The field value, e.g. `NTAG215`
+        """
+        return self.lines[self.fields[name]].partition(":")[2].strip()
+
+    @property
+    def uid(self) -> bytearray:
+        return bytearray.fromhex(self.get_field("UID"))
+
+    def get_page(self, page: int) -> bytes:
+        return bytes.fromhex(self.lines[self.pages[page]].partition(":")[2])
+
+    def set_page(self, page: int, data):
+        """
+        :param page: Page number, which must already be present in the file
+        :param data: The new page bytes
+        """
+        self.lines[self.pages[page]] = format_new_page(f"Page {page}:", data)
+
+    def to_text(self) -> str:
+        return "".join(self.lines)
+
+
 def save_ntag215_v2_with_pwd(current_ntag215_path, new_ntag215_path):
      '''
      Opens .nfc files calculates password and PACK and saves to new location
      :param current_ntag215_path: path to current .nfc file
      :param new_ntag215_path: path to save new .nfc file with password
      '''
-     with open(current_ntag215_path, "r") as file:
+     with _stage("read"), open(current_ntag215_path, "r") as file:
         lines = file.readlines()
+     _count_bytes("read", sum(map(len, lines)))
+
+     with _stage("convert"):
+        patch_nfc_lines(lines)
+
+     # converting in place replaces the only copy of the card, so that one always reaches the disk first
+     in_place = os.path.abspath(current_ntag215_path) == os.path.abspath(new_ntag215_path)
+     with _stage("write"), atomic_open(new_ntag215_path, sync=in_place) as f_new:
+        f_new.writelines(lines)
+     _count_bytes("write", sum(map(len, lines)))
+
+def patch_nfc_lines(lines):
+    '''
+    Calculates password and PACK for a .nfc file read by lines and stores them in its pages
+    :param lines: .nfc file content, modified in place
+    :return: the same lines
+    '''
+    document = NfcDocument(lines)
+    document.set_page(133, calculate_password(document.uid))
+    document.set_page(134, [PACK[0], PACK[1], 0, 0])
+    return document.lines
+
+def patch_nfc_text(text: str) -> str:
+    '''
+    Calculates password and PACK for the text of a .nfc file, read with universal newlines like open() does
+    :param text: .nfc file content
+    :return: the patched .nfc file content
+    '''
+    return "".join(patch_nfc_lines(io.StringIO(text, newline=None).readlines()))
+
+NFC_FILETYPE = b"Filetype: Flipper NFC device"
+
+def convert_dump(contents: bytes) -> str:
+    """
+    Converts a dump held in memory, whichever format it is in
+    :param contents: Either a raw .bin dump or the text of a Flipper .nfc file, as bytes or any other buffer
+    :return: The Flipper .nfc document with PWD and PACK set
+    """
+    if bytes(contents[: len(NFC_FILETYPE)]) == NFC_FILETYPE:
+        return patch_nfc_text(str(contents, "utf-8"))
+    return assemble_code(contents)
+
+def get_output_name(name: str) -> Optional[str]:
+    """
+    :param name: An input file name, e.g. Foo.bin
+    :return: The name of its converted version, e.g. Foo.nfc, or None if the file isn't one we convert
+    """
+    input_extension = os.path.splitext(name)[1]
+    if input_extension == ".bin":
+        return f"{name.split('.bin')[0]}.nfc"
+    elif input_extension == ".nfc":
+        return name
+    return None
 
-        uid = get_uid_bytes(get_uid_string(lines))
-        pwd = calculate_password(uid)
 
-        save_pwd_to_page(lines, pwd)            
-        save_pack_to_page(lines, [0x80, 0x80])
+def get_output_file(input_path: str, output_path: str) -> Optional[str]:
+    """
+    Works out where convert_file will write the converted version of a file
+    :param input_path: The full path to the .bin or .nfc file
+    :param output_path: The base directory to output to
+    :return: The output file path, or None if the file isn't one we convert
+    """
+    output_name = get_output_name(os.path.split(input_path)[1])
+    if output_name is None:
+        return None
+    return os.path.join(output_path, output_name)
 
-        with open(new_ntag215_path, "w+") as f_new:
-            f_new.writelines(lines)
 
-def convert_file(input_path: str, output_path: str):
+def convert_file(input_path: str, output_path: str) -> bool:
     """
     Handles reading, converting, and writing a single file
     :param input_path: The full path to the .bin file
     :param output_path: The base directory to output to
+    :return: True if the file was converted, False if it was skipped
     """
     input_extension = os.path.splitext(input_path)[1]
-    if input_extension == ".bin":
-        logging.info(f"Writing: {os.path.join(output_path, os.path.splitext(os.path.basename(input_path))[0])}.nfc")
-        with open(input_path, "rb") as file:
+    if input_extension not in (".bin", ".nfc"):
+        logging.info(f"{input_path} doesn't seem like a relevant file, skipping")
+        return False
+
+    name = os.path.split(input_path)[1]
+    output_file = get_output_file(input_path, output_path)
+    cache = _cache
+    key = None
+    if cache is not None or input_extension == ".bin":
+        with _stage("read"), open(input_path, "rb") as file:
             contents = file.read()
-            name = os.path.split(input_path)[1]
-            write_output(name.split(".bin")[0], assemble_code(contents), output_path)
+        _count_bytes("read", len(contents))
+        if cache is not None:
+            key = cache.key(name, contents)
+            in_place = os.path.abspath(output_file) == os.path.abspath(input_path)
+            if cache.fetch(key, output_file, sync=in_place):
+                logging.info(f"Writing: {output_file} (cached)")
+                return True
 
-    elif input_extension == ".nfc":
-        name = os.path.split(input_path)[1]
-        output_path = os.path.join(output_path, name)
-        save_ntag215_v2_with_pwd(input_path, output_path)
+    if input_extension == ".bin":
+        logging.info(f"Writing: {os.path.join(output_path, os.path.splitext(os.path.basename(input_path))[0])}.nfc")
+        document = get_render_buffer().render(contents)
+        write_document(output_file, [document])
+        if key is not None:
+            cache.store(key, output_file, bytes(document))
     else:
-        logging.info(f"{input_path} doesn't seem like a relevant file, skipping")
+        save_ntag215_v2_with_pwd(input_path, output_file)
+        if key is not None:
+            cache.store(key, output_file)
+    return True
 
 
-def process(path: str, output_path: str, tree: bool):
+def iter_records(contents: memoryview, record_size: int, offset: int = 0) -> Iterator[Tuple[int, memoryview]]:
     """
-    Process an input file, or walk through an input directory and process every matching .bin file therein
-    :param path: Path to a single file or a directory containing one or more .bin files
+    Splits a container of concatenated fixed-size dumps into its records, as views into the container
+    :param contents: The container, e.g. from map_file
+    :param record_size: Size of every record, e.g. 540 or 572
+    :param offset: Bytes to skip at the start of the container before the first record
+    :return: (record index, record view) for every complete record
+    """
+    count, remainder = divmod(max(len(contents) - offset, 0), record_size)
+    if remainder:
+        logging.warning(f"Ignoring {remainder} trailing bytes that don't make up a whole {record_size} byte record")
+    for index in range(count):
+        start = offset + index * record_size
+        yield index, contents[start : start + record_size]
+
+
+def convert_container(input_path: str, output_path: str, record_size: int, offset: int = 0) -> int:
+    """
+    Converts every record of a container of concatenated fixed-size dumps into its own .nfc file,
+    in a single sequential pass over the memory-mapped container.
+    Record N of Foo.dat is written to Foo_00000N.nfc
+    :param input_path: The full path to the container
     :param output_path: The base directory to output to
+    :param record_size: Size of every record, e.g. 540 or 572
+    :param offset: Bytes to skip at the start of the container before the first record
+    :return: The number of records converted
     """
-    if os.path.isfile(path):
-        convert_file(path, output_path)
-    else:
-        if tree:
-            new_output_path = os.path.join(output_path, pathlib.Path(*pathlib.Path(path).parts[1:]))
-            os.makedirs(new_output_path, exist_ok=True)
-        else:
-            new_output_path = output_path
-        for filename in os.listdir(path):
-            new_path = os.path.join(path, filename)
-            logging.debug(f"Current file: {filename}; Current path: {new_path}")
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    converted = 0
+    with map_file(input_path) as contents:
+        _count_bytes("read", len(contents))
+        for index, record in iter_records(contents, record_size, offset):
+            with record:
+                write_document(os.path.join(output_path, f"{stem}_{index:06d}.nfc"), [get_render_buffer().render(record)])
+            converted += 1
+    logging.info(f"Converted {converted} records from {input_path}")
+    return converted
 
-            if os.path.isfile(new_path):
-                convert_file(new_path, new_output_path)
-            else:
-                logging.debug(f"Recursing into: {new_path}")
-                process(new_path, output_path, tree)
+
+def get_contents_uid(name: str, contents: bytes) -> Optional[bytes]:
+    """
+    :param name: The file name, e.g. Foo.bin or Foo.nfc
+    :param contents: The file's contents, or for a .bin at least its first 8 bytes
+    :return: The 7-byte UID of a dump, or None if it hasn't got one
+    """
+    if os.path.splitext(name)[1] == ".nfc":
+        document = NfcDocument.from_text(str(contents, "utf-8"))
+        return bytes(document.uid) if "UID" in document.fields else None
+    if len(contents) < 8:
+        return None
+    return bytes(contents[i] for i in UID_OFFSETS)
 
 
-def get_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "-i",
-        "--input-path",
-        required=True,
-        type=pathlib.Path,
-        help="Single file or directory tree to convert.",
-    )
-    parser.add_argument(
-        "-o",
-        "--output-path",
-        required=False,
-        type=pathlib.Path,
-        help="Directory to store output in. Will be created if it doesn't exist. If not specified, the output will be "
-        "stored in the same location as the original, with a '.nfc' extension.",
-    )
-    parser.add_argument(
-        "-v",
-        "--verbose",
-        action="count",
-        default=0,
-        help="Show extra info: pass -v to see what's going on, pass -vv to get useful debug info.",
-    )
-    parser.add_argument(
-        "-t",
-        "--tree",
-        action="store_true",
-        default=False,
-        help="Keep the same folder structure from the input folder to the output folder.",
-    )
-    args = parser.parse_args()
-    if args.verbose >= 2:
-        # set debug
-        logging.basicConfig(level=logging.DEBUG)
-    elif args.verbose >= 1:
-        # set info
-        logging.basicConfig(level=logging.INFO)
-    logging.debug(f"Parsed args into {args}")
-    return args
+def read_uid(input_path: str) -> Optional[bytes]:
+    """
+    Reads just enough of a file to get its UID: the first 8 bytes of a .bin, up to the UID line of a .nfc
+    :param input_path: The full path to the .bin or .nfc file
+    :return: The 7-byte UID, or None for other files and files without a UID
+    """
+    input_extension = os.path.splitext(input_path)[1]
+    if input_extension == ".bin":
+        with open(input_path, "rb") as file:
+            return get_contents_uid(input_path, file.read(8))
+    elif input_extension == ".nfc":
+        with open(input_path, "r") as file:
+            for line in file:
+                if line.startswith("UID:"):
+                    return bytes(get_uid_bytes(line))
+    return None
 
 
-def main():
-    args = get_args()
+DUPLICATES_NAME = ".ntag215_duplicates.json"
+DUPLICATE_POLICIES = ("all", "first", "report")
 
-    # single file mode
-    if os.path.isfile(args.input_path):
-        if not args.output_path:
-            args.output_path = os.path.split(args.input_path)[0]
-    # recursive directory mode
-    elif os.path.isdir(args.input_path):
-        if not args.output_path:
-            logging.exception(
-                ValueError(
-                    f"{args.input_path} is a directory, but no output path given."
-                )
-            )
-        logging.debug(f"Going to create output directory {args.output_path}")
-        os.makedirs(args.output_path, exist_ok=True)
-    elif not os.path.exists(args.input_path):
-        logging.exception(
-            FileNotFoundError(f"{args.input_path} doesn't actually exist")
-        )
 
-    logging.debug(f"input: {args.input_path}, output: {args.output_path}")
-    process(args.input_path, args.output_path, args.tree)
+class UidIndex:
+    """
+    Maps every UID seen during a run to the inputs it came from, to spot the same tag stored under different names
+    """
+
+    def __init__(self):
+        self.paths: Dict[bytes, List[str]] = {}
+
+    def add(self, uid: bytes, path: str) -> bool:
+        """
+        :return: True if this is the first input with this UID
+        """
+        paths = self.paths.setdefault(uid, [])
+        paths.append(path)
+        return len(paths) == 1
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """
+        :return: UID (hex) -> every input holding it, first one first, for UIDs seen more than once
+        """
+        return {uid.hex(" ").upper(): paths for uid, paths in sorted(self.paths.items()) if len(paths) > 1}
+
+    def write_report(self, path: str):
+        duplicates = self.duplicates()
+        with atomic_open(path) as f:
+            json.dump(duplicates, f, indent=1)
+        logging.info(f"Wrote {len(duplicates)} duplicated UIDs to {path}")
+
+
+def dedupe(items: Iterable[tuple], uid_of: Callable, index: UidIndex, policy: str, summary: "RunSummary") -> Iterator:
+    """
+    Records the UID of every work item in the index and, with the "first" policy, drops items whose UID was seen before
+    :param items: Work items whose first element is the input's name or path
+    :param uid_of: Returns an item's UID, or None if it hasn't got one
+    :param index: Index to record the UIDs in
+    :param policy: One of DUPLICATE_POLICIES
+    :param summary: Counts the dropped duplicates
+    """
+    for item in items:
+        try:
+            uid = uid_of(item)
+        except Exception as e:
+            # conversion will report what's wrong with the file
+            logging.debug(f"Couldn't read the UID of {item[0]}: {e!r}")
+            uid = None
+        if uid is not None and not index.add(uid, str(item[0])) and policy == "first":
+            logging.info(f"{item[0]} has the same UID as {index.paths[uid][0]}, skipping")
+            summary.duplicates += 1
+            continue
+        yield item
+
+
+class RunSummary:
+    """
+    Collects the outcome of every file handled during a run
+    """
+
+    def __init__(self):
+        self.converted = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.failed: List[Tuple[str, str]] = []
+
+    def add(self, input_path: str, converted, error: str = None):
+        if error is not None:
+            self.failed.append((input_path, error))
+        elif converted:
+            self.converted += 1
+        else:
+            self.skipped += 1
+
+    def report(self) -> str:
+        """
+        :return: A summary of the run. Failures are sorted by path so the report doesn't depend on completion order
+        """
+        lines = [
+            f"Converted: {self.converted}, Unchanged: {self.unchanged}, Duplicates: {self.duplicates}, "
+            f"Skipped: {self.skipped}, Failed: {len(self.failed)}"
+        ]
+        for input_path, error in sorted(self.failed):
+            lines.append(f"FAILED {input_path}: {error}")
+        return "\n".join(lines)
+
+
+MANIFEST_NAME = ".ntag215_manifest.json"
+
+
+def hash_file(path: str) -> str:
+    """
+    :return: The sha256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Remembers the fingerprint (size, mtime, content hash) of every converted input and where its output went,
+    so incremental runs can skip inputs that haven't changed since they were last converted
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The manifest file, usually MANIFEST_NAME inside the output directory
+        """
+        self.path = path
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+            logging.debug(f"Loaded {len(self.entries)} manifest entries from {path}")
+
+    def is_current(self, input_path: str, output_file: str) -> Tuple[bool, Optional[str]]:
+        """
+        Checks an input against its manifest entry. The content is only hashed when size matches but mtime doesn't.
+        :return: (whether the input and its output are unchanged, the content hash if it had to be computed)
+        """
+        entry = self.entries.get(os.path.abspath(input_path))
+        if entry is None or entry["output"] != os.path.abspath(output_file):
+            return False, None
+        try:
+            out_stat = os.stat(output_file)
+        except FileNotFoundError:
+            return False, None
+        if (out_stat.st_size, out_stat.st_mtime_ns) != (entry["output_size"], entry["output_mtime_ns"]):
+            return False, None
+
+        in_stat = os.stat(input_path)
+        if in_stat.st_size != entry["size"]:
+            return False, None
+        if in_stat.st_mtime_ns == entry["mtime_ns"]:
+            return True, entry["sha256"]
+        digest = hash_file(input_path)
+        if digest != entry["sha256"]:
+            return False, digest
+        # touched, but the content is the same
+        entry["mtime_ns"] = in_stat.st_mtime_ns
+        return True, digest
+
+    def record(self, input_path: str, output_file: str, digest: str = None):
+        """
+        Stores the current fingerprint of an input and its output, after a successful conversion
+        """
+        in_stat = os.stat(input_path)
+        out_stat = os.stat(output_file)
+        self.entries[os.path.abspath(input_path)] = {
+            "size": in_stat.st_size,
+            "mtime_ns": in_stat.st_mtime_ns,
+            "sha256": digest or hash_file(input_path),
+            "output": os.path.abspath(output_file),
+            "output_size": out_stat.st_size,
+            "output_mtime_ns": out_stat.st_mtime_ns,
+        }
+
+    def save(self):
+        with atomic_open(self.path) as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+
+# bump whenever the converted output changes, so the output cache never serves documents from an older converter
+CONVERTER_VERSION = "1"
+
+
+class OutputCache:
+    """
+    Content-addressed cache of converted documents, so byte-identical inputs stored under different paths are
+    only converted once. Entries are keyed by the sha256 of the converter version, the input type and the input's
+    bytes, and kept on disk in `directory` plus in an LRU-bounded in-memory layer.
+
+    Hits are hard-linked into place where the cache and the output share a filesystem, otherwise written from
+    memory (or the on-disk copy). Hard-linked outputs share their contents with the cache: replace them, never edit
+    them in place
+    """
+
+    def __init__(self, directory: str, memory_bytes: int = 64 << 20, link: bool = True):
+        """
+        :param directory: Where the on-disk store lives, created if needed
+        :param memory_bytes: Upper bound of the documents kept in memory, 0 for none
+        :param link: Serve hits by hard-linking them into place where possible
+        """
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.link = link
+        self.memory: "collections.OrderedDict[str, bytes]" = collections.OrderedDict()
+        self.memory_used = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(name: str, contents: bytes) -> str:
+        """
+        :param name: The input's file name; its extension picks the converter
+        :param contents: The input's bytes
+        :return: The cache key of the input's converted document
+        """
+        digest = hashlib.sha256(f"{CONVERTER_VERSION}\0{os.path.splitext(name)[1]}\0".encode())
+        digest.update(contents)
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.nfc")
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = data
+            self.memory_used += len(data)
+            while self.memory_used > self.memory_bytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_used -= len(evicted)
+
+    def _recall(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+            return data
+
+    def fetch(self, key: str, output_file: str, sync: bool = False) -> bool:
+        """
+        Puts the cached document for key at output_file, if there is one
+        :param sync: Write a copy and fsync it before replacing output_file, e.g. for a card converted in place
+        :return: True on a hit, False if key isn't cached
+        """
+        with _stage("cache"):
+            stored = self.path(key)
+            if self.link and not sync:
+                tmp_path = f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    os.link(stored, tmp_path)
+                except FileNotFoundError:
+                    return False
+                except OSError:
+                    # e.g. another filesystem, or no hard links there: copy the contents instead
+                    pass
+                else:
+                    try:
+                        os.replace(tmp_path, output_file)
+                    finally:
+                        # replacing a file with another link to itself leaves both names in place
+                        with contextlib.suppress(FileNotFoundError):
+                            os.unlink(tmp_path)
+                    _durability.committed(output_file)
+                    return True
+
+            data = self._recall(key)
+            if data is None:
+                try:
+                    with open(stored, "rb") as file:
+                        data = file.read()
+                except FileNotFoundError:
+                    return False
+                self._remember(key, data)
+            with atomic_write(output_file, sync) as fd:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view) :]
+        return True
+
+    def store(self, key: str, output_file: str, data: bytes = None):
+        """
+        Adds a freshly converted document to the cache
+        :param key: The input's cache key
+        :param output_file: Where the document was written
+        :param data: The document's bytes, if at hand - saves reading output_file back, and fills the in-memory layer
+        """
+        with _stage("cache"):
+            if data is not None:
+                self._remember(key, data)
+            stored = self.path(key)
+            if os.path.exists(stored):
+                return
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            # the store keeps its own copy: a link would let later edits of the output (or of a card converted
+            # in place) change the cache entry too
+            tmp_path = f"{stored}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                if data is None:
+                    shutil.copyfile(output_file, tmp_path)
+                else:
+                    with open(tmp_path, "wb") as file:
+                        file.write(data)
+                os.replace(tmp_path, stored)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+
+
+_cache: Optional[OutputCache] = None
+
+
+def set_cache(cache: Optional[OutputCache]):
+    """
+    Turns the output cache on (with an OutputCache to use) or off (with None) for convert_file
+    """
+    global _cache
+    _cache = cache
+
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(path: str) -> bool:
+    return str(path).lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_archive(path: str) -> Iterator[Tuple[str, bytes]]:
+    """
+    Reads the files in a .zip or .tar archive one at a time, without extracting anything to disk.
+    Tar archives are read as a stream, so compressed tars are never seeked through.
+    :param path: Path to the archive
+    :return: (member name, member contents) for every regular file in the archive
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with _stage("read"):
+                        contents = archive.read(info)
+                    _count_bytes("read", len(contents))
+                    yield info.filename, contents
+    else:
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    with _stage("read"):
+                        contents = archive.extractfile(member).read()
+                    _count_bytes("read", len(contents))
+                    yield member.name, contents
+
+
+def render_contents(name: str, contents: bytes) -> str:
+    """
+    Converts a file's contents, picking the converter from its extension
+    :param name: The file name, e.g. Foo.bin or Foo.nfc
+    :param contents: The file's contents
+    :return: The converted flipper-compatible contents
+    """
+    if os.path.splitext(name)[1] == ".nfc":
+        with _stage("convert"):
+            return patch_nfc_text(str(contents, "utf-8"))
+    return assemble_code(contents)
+
+
+def archive_name(directory: str, name: str) -> str:
+    """
+    :param directory: A relative directory, using the platform's separators
+    :param name: A file name
+    :return: The "/"-separated path of the file inside an archive
+    """
+    return "/".join([*pathlib.PurePath(directory).parts, name])
+
+
+def render_member(member_name: str, contents: bytes, tree: bool) -> Optional[Tuple[str, str]]:
+    """
+    Converts a single file read from an archive
+    :param member_name: The file's path inside the archive
+    :param contents: The file's contents
+    :param tree: Keep the member's folder structure in the output path
+    :return: ("/"-separated output path relative to the output root, converted contents),
+             or None if the file isn't one we convert
+    """
+    relative_path = member_output_path(member_name, tree)
+    if relative_path is None:
+        logging.info(f"{member_name} doesn't seem like a relevant file, skipping")
+        return None
+    return relative_path, render_contents(posixpath.basename(member_name), contents)
+
+
+def member_output_path(member_name: str, tree: bool) -> Optional[str]:
+    """
+    :param member_name: A file's path inside an archive
+    :param tree: Keep the member's folder structure in the output path
+    :return: The "/"-separated path of its converted version relative to the output root,
+             or None if the file isn't one we convert
+    """
+    member_dir, name = posixpath.split(member_name)
+    output_name = get_output_name(name)
+    if output_name is None:
+        return None
+    parts = [part for part in member_dir.split("/") if part not in ("", ".")] if tree else []
+    if ".." in parts:
+        raise ValueError(f"{member_name} points outside of the archive")
+    return "/".join([*parts, output_name])
+
+
+def render_file(input_path: str, out_dir: str) -> Optional[Tuple[str, str]]:
+    """
+    Reads and converts a single file, without writing it anywhere
+    :param input_path: The full path to the .bin or .nfc file
+    :param out_dir: The output directory, relative to the output root
+    :return: ("/"-separated output path relative to the output root, converted contents),
+             or None if the file isn't one we convert
+    """
+    name = os.path.split(input_path)[1]
+    output_name = get_output_name(name)
+    if output_name is None:
+        logging.info(f"{input_path} doesn't seem like a relevant file, skipping")
+        return None
+    with _stage("read"), open(input_path, "rb") as file:
+        contents = file.read()
+    _count_bytes("read", len(contents))
+    return archive_name(out_dir, output_name), render_contents(name, contents)
+
+
+def convert_member(member_name: str, contents: bytes, output_path: str, tree: bool) -> bool:
+    """
+    Handles converting and writing a single file read from an archive
+    :param member_name: The file's path inside the archive
+    :param contents: The file's contents
+    :param output_path: The base directory to output to
+    :param tree: Keep the member's folder structure inside output_path
+    :return: True if the file was converted, False if it was skipped
+    """
+    rendered = render_member(member_name, contents, tree)
+    if rendered is None:
+        return False
+    relative_path, assemble = rendered
+    output_file = os.path.join(output_path, *relative_path.split("/"))
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    logging.info(f"Writing: {output_file}")
+    with _stage("write"), atomic_open(output_file) as f:
+        f.write(assemble)
+    _count_bytes("write", len(assemble))
+    return True
+
+
+class ArchiveSink:
+    """
+    Writes converted documents into a single .zip or .tar archive instead of one file each
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The archive to create. Its extension picks the format and compression
+        """
+        self.path = str(path)
+        self.names = set()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # the archive only replaces path once it's complete
+        self.writer = atomic_open(self.path, "wb")
+        self.file = self.writer.__enter__()
+        lower = self.path.lower()
+        if lower.endswith(".zip"):
+            self.zip = zipfile.ZipFile(self.file, "w", compression=zipfile.ZIP_DEFLATED)
+            self.tar = None
+        else:
+            mode = "w"
+            for extensions, compression in (((".tar.gz", ".tgz"), "gz"), ((".tar.bz2",), "bz2"), ((".tar.xz",), "xz")):
+                if lower.endswith(extensions):
+                    mode = f"w:{compression}"
+            self.zip = None
+            self.tar = tarfile.open(fileobj=self.file, mode=mode)
+
+    def write(self, name: str, assemble: str):
+        """
+        :param name: "/"-separated path of the document inside the archive
+        :param assemble: The converted flipper-compatible contents
+        """
+        if name in self.names:
+            raise FileExistsError(f"{name} was already written to {self.path}")
+        self.names.add(name)
+        data = assemble.encode()
+        with _stage("write"):
+            if self.zip is not None:
+                self.zip.writestr(name, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self.tar.addfile(info, io.BytesIO(data))
+        _count_bytes("write", len(data))
+
+    def close(self, *exc):
+        """
+        Finishes the archive and moves it into place, or discards it when called with an exception
+        """
+        try:
+            (self.zip or self.tar).close()
+        except BaseException:
+            self.writer.__exit__(*sys.exc_info())
+            raise
+        self.writer.__exit__(*(exc or (None, None, None)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close(*exc)
+
+
+class Catalog:
+    """
+    SQLite database of converted tags - UID, PWD, PACK, source file, content hash and output file -
+    indexed by UID and PWD, to find out where a tag came from without re-reading any dumps
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tags (
+            source TEXT PRIMARY KEY,
+            uid TEXT NOT NULL,
+            pwd TEXT,
+            pack TEXT,
+            sha256 TEXT NOT NULL,
+            output TEXT NOT NULL,
+            converted_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tags_uid ON tags (uid);
+        CREATE INDEX IF NOT EXISTS tags_pwd ON tags (pwd);
+    """
+
+    def __init__(self, path: str, batch: int = 1000):
+        """
+        :param path: The database file, created if it doesn't exist
+        :param batch: Rows written per transaction
+        """
+        # rows are added from whichever thread finishes a file (e.g. in pipeline mode), one at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+        self.batch = batch
+        self.uncommitted = 0
+
+    def add(self, source: str, uid: bytes, sha256: str, output: str):
+        """
+        Records a converted tag, replacing any earlier record for the same source file
+        :param source: The input file
+        :param uid: The tag's 7-byte UID
+        :param sha256: Hex digest of the input file's contents
+        :param output: The converted file
+        """
+        pwd = bytes(calculate_password(uid))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(source), uid.hex().upper(), pwd.hex().upper(), PACK.hex().upper(), sha256,
+             os.path.abspath(output), time.time()),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.batch:
+            self.commit()
+
+    def add_contents(self, source: str, contents: bytes, output: str):
+        """
+        Records a converted input held in memory, e.g. an archive member
+        :param source: Where the input came from, e.g. Foo.zip/Bar.bin; its extension tells .bin and .nfc apart
+        :param contents: The input's contents
+        :param output: The converted file, or its path inside an output archive
+        """
+        self.add_entry(source, catalog_entry(source, contents), output)
+
+    def add_entry(self, source: str, entry: Tuple[Optional[bytes], str], output: str):
+        """
+        Records a converted input from its catalog_entry, e.g. one worked out by the worker that converted it
+        """
+        uid, sha256 = entry
+        if uid is None:
+            logging.debug(f"{source} has no UID, not adding it to the catalog")
+            return
+        self.add(source, uid, sha256, output)
+
+    def lookup(self, value: str) -> List[dict]:
+        """
+        :param value: A UID (7 bytes) or PWD (4 bytes) in hex; spaces and colons are ignored
+        :return: Every tag with that UID or PWD
+        """
+        value = value.replace(" ", "").replace(":", "").upper()
+        column = {14: "uid", 8: "pwd"}.get(len(value))
+        if column is None:
+            raise ValueError(f"{value} is neither a 7-byte UID nor a 4-byte PWD")
+        cursor = self.connection.execute(f"SELECT * FROM tags WHERE {column} = ? ORDER BY source", (value,))
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def catalog_entry(name: str, contents: bytes) -> Tuple[Optional[bytes], str]:
+    """
+    :param name: The input's file name, e.g. Foo.bin or Foo.nfc
+    :param contents: The input's contents, as read before converting it
+    :return: (its 7-byte UID, or None if it hasn't got one; sha256 hex digest of contents), as Catalog records them
+    """
+    uid = get_contents_uid(name, contents)
+    return (uid if uid is not None and len(uid) == 7 else None), hashlib.sha256(contents).hexdigest()
+
+
+def catalogued(func: Callable, input_path: str, *args) -> Tuple[object, Tuple[Optional[bytes], str]]:
+    """
+    Runs func(input_path, *args), e.g. convert_file, and works out the input's catalog_entry first,
+    so it describes the input as it was - even when converted in place - and is computed by the worker, not the parent
+    :return: (what func returned, catalog_entry of the input)
+    """
+    with open(input_path, "rb") as file:
+        entry = catalog_entry(input_path, file.read())
+    return func(input_path, *args), entry
+
+
+def _run_job(key: str, func: Callable, *args) -> Tuple[str, object, str]:
+    """
+    Runs a conversion and turns any exception into an error message, so it can be shipped back from a worker process
+    :param key: What's being converted, for the summary - usually the input path
+    :param func: convert_file, convert_member or similar, returning whether anything was converted,
+                 or render_file/render_member, returning what was rendered
+    :return: (key, func's result or None on failure, error message or None)
+    """
+    try:
+        return key, func(*args), None
+    except Exception as e:
+        logging.error(f"Failed to convert {key}: {e!r}")
+        return key, None, repr(e)
+
+
+def _init_worker(stats: bool, durability: str, cache: Optional[tuple]):
+    """
+    Sets up a worker process like its parent: stats collection on or off, the same durability mode,
+    with files to batch-sync shipped back to the parent instead of synced by every worker on its own,
+    and the same output cache, given as (directory, memory_bytes, link) - each worker gets its own in-memory layer
+    """
+    set_stats(RunStats() if stats else None)
+    set_durability(Durability(durability, batch=0))
+    set_cache(OutputCache(*cache) if cache is not None else None)
+
+
+def _run_job_in_worker(key: str, func: Callable, *args) -> Tuple[Tuple[str, object, str], Optional[dict], List[str]]:
+    """
+    Runs _run_job in a worker process and ships the worker's stage statistics and unsynced files back with the result
+    """
+    result = _run_job(key, func, *args)
+    return result, _stats.drain() if _stats is not None else None, _durability.drain()
+
+
+def run_jobs(tasks: Iterable[Tuple[str, Callable, tuple]], jobs: int, finish: Callable):
+    """
+    Runs conversion tasks, either one at a time or fanned out over a process pool
+    :param tasks: (key, func, args) for each conversion; func and args must be picklable when jobs > 1
+    :param jobs: Number of worker processes. With more than one, tasks run in a process pool
+    :param finish: Called with (key, result, error) as every task completes
+    """
+    if jobs <= 1:
+        for key, func, args in tasks:
+            finish(*_run_job(key, func, *args))
+        return
+
+    stats = _stats
+    durability = _durability
+    cache = (_cache.directory, _cache.memory_bytes, _cache.link) if _cache is not None else None
+
+    def complete(future: concurrent.futures.Future):
+        result, stages, written = future.result()
+        if stages is not None:
+            stats.merge(stages)
+        for path in written:
+            durability.committed(path)
+        finish(*result)
+
+    # keep a bounded number of tasks in flight, so memory stays flat however many there are
+    max_in_flight = jobs * 4
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(stats is not None, durability.mode, cache)
+    ) as executor:
+        pending = set()
+        for key, func, args in tasks:
+            if len(pending) >= max_in_flight:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    complete(future)
+            pending.add(executor.submit(_run_job_in_worker, key, func, *args))
+        for future in concurrent.futures.as_completed(pending):
+            complete(future)
+
+
+def run_pipeline(
+    files: Iterable[Tuple[str, str]],
+    finish: Callable,
+    io_threads: int = 8,
+    queue_size: int = 64,
+    inspect: Callable = None,
+):
+    """
+    Converts files with reads, conversion and writes overlapping, for I/O-latency-bound (e.g. network) filesystems.
+
+    Reader threads read whole files, one conversion thread renders them and writer threads write the results.
+    The stages are connected by bounded queues, so many reads and writes are in flight while the CPU keeps converting,
+    without the whole tree piling up in memory.
+    Every file is rendered, written and cached exactly like convert_file does, so the output is the same either way.
+    :param files: (input path, output directory) for every file, e.g. from iter_files
+    :param finish: Called with (input path, converted, error) as every file completes, from any thread
+    :param io_threads: Number of reader threads and of writer threads
+    :param queue_size: Capacity of each queue between the stages
+    :param inspect: If given, called by the reader threads with (input path, contents) of every file; finish then
+                    gets (converted, what inspect returned) for every converted file, e.g. with catalog_entry
+    """
+    to_read = queue.Queue(queue_size)
+    to_convert = queue.Queue(queue_size)
+    to_write = queue.Queue(queue_size)
+    finish_lock = threading.Lock()
+    done = object()
+
+    def complete(input_path: str, converted: bool, error: str = None):
+        # a stage thread must never die, or the stages upstream of it would block forever
+        try:
+            with finish_lock:
+                finish(input_path, converted, error)
+        except Exception as e:
+            logging.error(f"Failed to finish {input_path}: {e!r}")
+
+    def fail(input_path: str, e: Exception):
+        logging.error(f"Failed to convert {input_path}: {e!r}")
+        complete(input_path, None, repr(e))
+
+    def reader():
+        while (item := to_read.get()) is not done:
+            input_path, output_file = item
+            cache = _cache
+            key = None
+            try:
+                contents = _read_file(input_path)
+                info = inspect(input_path, contents) if inspect is not None else None
+                if cache is not None:
+                    key = cache.key(os.path.split(input_path)[1], contents)
+                    in_place = os.path.abspath(output_file) == os.path.abspath(input_path)
+                    if cache.fetch(key, output_file, sync=in_place):
+                        logging.info(f"Writing: {output_file} (cached)")
+                        complete(input_path, True if inspect is None else (True, info))
+                        continue
+            except Exception as e:
+                fail(input_path, e)
+                continue
+            to_convert.put((input_path, output_file, contents, info, key))
+
+    def converter():
+        while (item := to_convert.get()) is not done:
+            input_path, output_file, contents, info, key = item
+            name = os.path.split(input_path)[1]
+            try:
+                if os.path.splitext(name)[1] == ".nfc":
+                    document = render_contents(name, contents)
+                else:
+                    # the render buffer is reused for the next file while this one waits for a writer
+                    document = bytes(get_render_buffer().render(contents))
+            except Exception as e:
+                fail(input_path, e)
+                continue
+            to_write.put((input_path, output_file, document, info, key))
+
+    def writer():
+        while (item := to_write.get()) is not done:
+            input_path, output_file, document, info, key = item
+            try:
+                logging.info(f"Writing: {output_file}")
+                if isinstance(document, str):
+                    # a .nfc keeps the line endings save_ntag215_v2_with_pwd would give it
+                    in_place = os.path.abspath(output_file) == os.path.abspath(input_path)
+                    _write_file(output_file, document, in_place)
+                    if key is not None:
+                        _cache.store(key, output_file)
+                else:
+                    write_document(output_file, [document])
+                    if key is not None:
+                        _cache.store(key, output_file, document)
+            except Exception as e:
+                fail(input_path, e)
+                continue
+            complete(input_path, True if inspect is None else (True, info))
+
+    def start(target: Callable, count: int) -> List[threading.Thread]:
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    readers = start(reader, io_threads)
+    converters = start(converter, 1)
+    writers = start(writer, io_threads)
+    try:
+        for input_path, out_dir in files:
+            output_file = get_output_file(input_path, out_dir)
+            if output_file is None:
+                logging.info(f"{input_path} doesn't seem like a relevant file, skipping")
+                complete(input_path, False)
+                continue
+            to_read.put((input_path, output_file))
+    finally:
+        # shut the stages down in order, each one only after everything upstream has drained into it
+        for stage_queue, threads in ((to_read, readers), (to_convert, converters), (to_write, writers)):
+            for _ in threads:
+                stage_queue.put(done)
+            for thread in threads:
+                thread.join()
+
+
+def _read_file(path: str) -> bytes:
+    with _stage("read"), open(path, "rb") as file:
+        contents = file.read()
+    _count_bytes("read", len(contents))
+    return contents
+
+
+def _write_file(path: str, assemble: str, sync: bool = False):
+    with _stage("write"), atomic_open(path, sync=sync) as f:
+        f.write(assemble)
+    _count_bytes("write", len(assemble))
+
+
+def _write_output(output_path: str, output_file: str, assemble: str):
+    os.makedirs(output_path, exist_ok=True)
+    _write_file(output_file, assemble)
+
+
+class AsyncConverter:
+    """
+    Conversion API for asyncio applications. File I/O runs in threads and conversion in an executor,
+    so the event loop is never blocked; a semaphore caps how many conversions run at once
+    """
+
+    def __init__(self, concurrency: int = 16, executor: concurrent.futures.Executor = None):
+        """
+        :param concurrency: Maximum number of conversions in flight
+        :param executor: Where conversion CPU work runs, e.g. a ProcessPoolExecutor to use several cores.
+                         None uses the event loop's default thread pool
+        """
+        self.concurrency = concurrency
+        self.executor = executor
+        self._loop = None
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """
+        The running event loop's semaphore. An asyncio semaphore can't be shared between loops,
+        so a converter used by several asyncio.run() calls in turn gets a fresh one for each
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _render(self, name: str, contents: bytes) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, render_contents, name, contents)
+
+    async def convert_bytes(self, contents: bytes) -> str:
+        """
+        :param contents: Either a raw .bin dump or the text of a Flipper .nfc file
+        :return: The Flipper .nfc document with PWD and PACK set
+        """
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, convert_dump, contents)
+
+    async def convert_path(self, input_path: str, output_path: str) -> Optional[str]:
+        """
+        Handles reading, converting, and writing a single file, like convert_file
+        :param input_path: The full path to the .bin or .nfc file
+        :param output_path: The base directory to output to, created if it doesn't exist
+        :return: The file written, or None if the file was skipped
+        """
+        output_file = get_output_file(input_path, output_path)
+        if output_file is None:
+            logging.info(f"{input_path} doesn't seem like a relevant file, skipping")
+            return None
+        async with self.semaphore:
+            contents = await asyncio.to_thread(_read_file, input_path)
+            assemble = await self._render(os.path.split(input_path)[1], contents)
+            logging.info(f"Writing: {output_file}")
+            await asyncio.to_thread(_write_output, output_path, output_file, assemble)
+        return output_file
+
+    async def convert_paths(self, files: Iterable[Tuple[str, str]]) -> RunSummary:
+        """
+        Converts many files, with at most `concurrency` in flight and without creating a task per file.
+        files is advanced in a thread too, so a lazy directory walk doesn't block the event loop either
+        :param files: (input path, output directory) for every file, e.g. from iter_files
+        :return: The successes and failures of the run
+        """
+        summary = RunSummary()
+        files = iter(files)
+        # a generator can't be advanced from two threads at once
+        advancing = asyncio.Lock()
+        done = object()
+
+        async def next_file():
+            async with advancing:
+                return await asyncio.to_thread(next, files, done)
+
+        async def worker():
+            while (item := await next_file()) is not done:
+                input_path, out_dir = item
+                try:
+                    summary.add(input_path, await self.convert_path(input_path, out_dir) is not None)
+                except Exception as e:
+                    logging.error(f"Failed to convert {input_path}: {e!r}")
+                    summary.add(input_path, None, repr(e))
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return summary
+
+
+# shared by every convert_bytes() and convert_path() call that doesn't bring its own, so they share one limit
+_default_converter = AsyncConverter()
+
+
+async def convert_bytes(contents: bytes, converter: AsyncConverter = None) -> str:
+    """
+    Async version of convert_dump
+    :param contents: Either a raw .bin dump or the text of a Flipper .nfc file
+    :param converter: Sets the concurrency limit and executor; a shared default AsyncConverter if not given
+    :return: The Flipper .nfc document with PWD and PACK set
+    """
+    return await (converter or _default_converter).convert_bytes(contents)
+
+
+async def convert_path(input_path: str, output_path: str, converter: AsyncConverter = None) -> Optional[str]:
+    """
+    Async version of convert_file
+    :param input_path: The full path to the .bin or .nfc file
+    :param output_path: The base directory to output to
+    :param converter: Sets the concurrency limit and executor; a shared default AsyncConverter if not given
+    :return: The file written, or None if the file was skipped
+    """
+    return await (converter or _default_converter).convert_path(input_path, output_path)
+
+
+def iter_files(path: str, output_path: str, tree: bool, make_dirs: bool = True) -> Iterator[Tuple[str, str]]:
+    """
+    Walk through an input directory, yielding every file together with the directory its output goes to.
+    Output directories are created as they are reached when keeping the folder structure.
+
+    The walk is iterative, with a stack of os.scandir() iterators rather than recursion, so deep trees can't hit the
+    recursion limit, and the file type comes from the cached DirEntry info instead of a stat per entry.
+    Files are yielded lazily in the same depth-first order as a recursive walk, so conversion starts right away.
+    An output folder inside the input folder is skipped, so earlier outputs are never taken for inputs.
+    :param path: Path to a single file or a directory containing one or more .bin files
+    :param output_path: The base directory to output to
+    :param tree: Keep the same folder structure from the input folder to the output folder
+    :param make_dirs: Create the output directories. Off when the output doesn't go to the filesystem
+    """
+    if os.path.isfile(path):
+        yield path, output_path
+        return
+
+    def output_dir_for(directory: str) -> str:
+        if not tree:
+            return output_path
+        new_output_path = os.path.join(output_path, pathlib.Path(*pathlib.Path(directory).parts[1:]))
+        if make_dirs:
+            os.makedirs(new_output_path, exist_ok=True)
+        return new_output_path
+
+    output_dir = os.path.abspath(output_path) if output_path else None
+    stack = [(os.scandir(path), output_dir_for(path))]
+    try:
+        while stack:
+            entries, new_output_path = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                entries.close()
+                stack.pop()
+                continue
+
+            logging.debug(f"Current file: {entry.name}; Current path: {entry.path}")
+            if entry.is_file():
+                yield entry.path, new_output_path
+            elif entry.is_dir():
+                if os.path.abspath(entry.path) == output_dir:
+                    logging.debug(f"{entry.path} is the output folder, skipping")
+                    continue
+                logging.debug(f"Recursing into: {entry.path}")
+                stack.append((os.scandir(entry.path), output_dir_for(entry.path)))
+            else:
+                logging.debug(f"{entry.path} is neither a file nor a directory, skipping")
+    finally:
+        for entries, _ in stack:
+            entries.close()
+
+
+# files in an input folder that --record-size treats as containers
+RECORD_GLOBS = ("*.bin", "*.dat")
+
+
+def process(
+    path: str,
+    output_path: str,
+    tree: bool,
+    jobs: int = 1,
+    incremental: bool = False,
+    force: bool = False,
+    pipeline: int = 0,
+    record_size: int = 0,
+    record_offset: int = 0,
+    duplicates: str = "all",
+    catalog: str = None,
+    record_globs: Iterable[str] = RECORD_GLOBS,
+) -> RunSummary:
+    """
+    Process an input file, or walk through an input directory and process every matching .bin file therein
+    :param path: Path to a single file, a .zip/.tar archive, or a directory containing one or more .bin files
+    :param output_path: The base directory to output to, or a .zip/.tar archive to write every document into
+    :param tree: Keep the same folder structure from the input folder to the output folder
+    :param jobs: Number of worker processes. With more than one, files are converted in a process pool
+    :param incremental: Skip inputs whose fingerprint and output match the manifest in output_path.
+                        Not available for archives
+    :param force: With incremental, convert everything anyway and rebuild the manifest
+    :param pipeline: If set, overlap reads, conversion and writes with this many reader and writer threads
+                     instead of using jobs. Only for directory output from a directory or single file
+    :param record_size: If set, every input file is a container of concatenated dumps of this size,
+                        see convert_container. Only for directory output from a directory or single file
+    :param record_offset: With record_size, bytes to skip at the start of each container
+    :param duplicates: What to do with inputs whose UID was already seen in this run: convert them all ("all"),
+                       only convert the first one ("first") or convert them all but list them ("report").
+                       Both "first" and "report" write the duplicates to DUPLICATES_NAME in output_path.
+                       Not available for containers
+    :param catalog: SQLite database to record every converted tag in, see Catalog. Not available for containers
+    :param record_globs: With record_size, only files in the input folder matching one of these patterns are
+                         containers, anything else is skipped
+    :return: The successes and failures of the run
+    """
+    summary = RunSummary()
+    if is_archive(output_path):
+        if incremental:
+            logging.warning(f"{output_path} is an archive, incremental mode doesn't apply")
+        return process_to_archive(path, output_path, tree, jobs, duplicates, catalog)
+
+    index = UidIndex() if duplicates != "all" else None
+    if is_archive(path) and os.path.isfile(path):
+        if incremental:
+            logging.warning(f"{path} is an archive, incremental mode doesn't apply")
+        members = iter_archive(path)
+        if index is not None:
+            members = dedupe(members, lambda member: get_contents_uid(*member), index, duplicates, summary)
+        tags = Catalog(catalog) if catalog is not None else None
+        # member key -> (member name, contents) until it is converted and can be catalogued
+        pending = {}
+
+        def tasks() -> Iterator[tuple]:
+            for member_name, contents in members:
+                key = os.path.join(path, member_name)
+                if tags is not None:
+                    pending[key] = member_name, contents
+                yield key, convert_member, (member_name, contents, output_path, tree)
+
+        def finish(key: str, converted: bool, error: str):
+            summary.add(key, converted, error)
+            if key in pending:
+                member_name, contents = pending.pop(key)
+                if converted and error is None:
+                    output_file = os.path.join(output_path, *member_output_path(member_name, tree).split("/"))
+                    tags.add_contents(key, contents, output_file)
+
+        try:
+            run_jobs(tasks(), jobs, finish)
+        finally:
+            if tags is not None:
+                tags.close()
+        if index is not None:
+            index.write_report(os.path.join(output_path, DUPLICATES_NAME))
+        return summary
+
+    if record_size:
+        if incremental or pipeline:
+            logging.warning("Containers are always converted in full, by the process pool")
+        if duplicates != "all":
+            logging.warning("Duplicates aren't looked for in containers, every record is converted")
+        walk_folder = os.path.isdir(path)
+
+        def tasks() -> Iterator[tuple]:
+            for input_path, out_dir in _timed(iter_files(path, output_path, tree), "walk"):
+                name = os.path.basename(input_path)
+                # a container given on its own is always converted, the ones in a folder have to match
+                if walk_folder and not any(fnmatch.fnmatch(name, pattern) for pattern in record_globs):
+                    logging.info(f"{input_path} doesn't seem like a container, skipping")
+                    summary.add(input_path, False)
+                    continue
+                yield input_path, convert_container, (input_path, out_dir, record_size, record_offset)
+
+        def finish(input_path: str, converted, error: str = None):
+            # convert_container returns how many records it converted, each one counts
+            if error is None and converted:
+                summary.converted += converted
+            else:
+                summary.add(input_path, converted, error)
+
+        run_jobs(tasks(), jobs, finish)
+        return summary
+
+    manifest = Manifest(os.path.join(output_path, MANIFEST_NAME)) if incremental else None
+    tags = Catalog(catalog) if catalog is not None else None
+    # input path -> (output file, content hash) for files recorded in the manifest or catalog once they are converted
+    tracked = {}
+
+    def work() -> Iterator[Tuple[str, str]]:
+        files = _timed(iter_files(path, output_path, tree), "walk")
+        if index is not None:
+            files = dedupe(files, lambda file: read_uid(file[0]), index, duplicates, summary)
+        for input_path, out_dir in files:
+            tracking = manifest is not None or tags is not None
+            output_file = get_output_file(input_path, out_dir) if tracking else None
+            if output_file is not None:
+                current, digest = (False, None) if force or manifest is None else manifest.is_current(
+                    input_path, output_file
+                )
+                if current:
+                    logging.info(f"{input_path} is unchanged, skipping")
+                    summary.unchanged += 1
+                    continue
+                tracked[input_path] = output_file, digest
+            yield input_path, out_dir
+
+    def finish(input_path: str, converted, error: str):
+        entry = None
+        if isinstance(converted, tuple):
+            # (converted, catalog entry) from catalogued or the pipeline
+            converted, entry = converted
+        summary.add(input_path, converted, error)
+        if input_path in tracked:
+            output_file, digest = tracked.pop(input_path)
+            if converted and error is None:
+                if manifest is not None:
+                    manifest.record(input_path, output_file, digest)
+                if tags is not None and entry is not None:
+                    tags.add_entry(input_path, entry, output_file)
+
+    try:
+        if pipeline:
+            run_pipeline(work(), finish, pipeline, inspect=catalog_entry if tags is not None else None)
+        else:
+            tasks = (
+                (input_path, catalogued, (convert_file, input_path, out_dir))
+                if tags is not None
+                else (input_path, convert_file, (input_path, out_dir))
+                for input_path, out_dir in work()
+            )
+            run_jobs(tasks, jobs, finish)
+        return summary
+    finally:
+        if manifest is not None:
+            manifest.save()
+        if tags is not None:
+            tags.close()
+        if index is not None:
+            index.write_report(os.path.join(output_path, DUPLICATES_NAME))
+
+
+def process_to_archive(
+    path: str, output_path: str, tree: bool, jobs: int = 1, duplicates: str = "all", catalog: str = None
+) -> RunSummary:
+    """
+    Process an input file, archive or directory like process(), writing every document into one output archive.
+    Workers only render documents; they are all written to the archive from this process.
+    :param path: Path to a single file, a .zip/.tar archive, or a directory containing one or more .bin files
+    :param output_path: The .zip/.tar archive to create
+    :param tree: Keep the input folder structure inside the archive
+    :param jobs: Number of worker processes. With more than one, files are converted in a process pool
+    :param duplicates: What to do with inputs whose UID was already seen, see process(). The duplicates report is
+                       written next to the archive
+    :param catalog: SQLite database to record every converted tag in, see Catalog. Outputs are recorded by their
+                    path inside the archive, e.g. out.zip/Foo.nfc
+    :return: The successes and failures of the run
+    """
+    summary = RunSummary()
+    index = UidIndex() if duplicates != "all" else None
+    tags = Catalog(catalog) if catalog is not None else None
+    # member key -> its contents until it is converted and can be catalogued
+    pending = {}
+    if is_archive(path) and os.path.isfile(path):
+        members = iter_archive(path)
+        if index is not None:
+            members = dedupe(members, lambda member: get_contents_uid(*member), index, duplicates, summary)
+
+        def tasks() -> Iterator[tuple]:
+            for member_name, contents in members:
+                key = os.path.join(path, member_name)
+                if tags is not None:
+                    pending[key] = contents
+                yield key, render_member, (member_name, contents, tree)
+
+        tasks = tasks()
+    else:
+        files = _timed(iter_files(path, "", tree, make_dirs=False), "walk")
+        if index is not None:
+            files = dedupe(files, lambda file: read_uid(file[0]), index, duplicates, summary)
+        tasks = (
+            (input_path, catalogued, (render_file, input_path, out_dir))
+            if tags is not None
+            else (input_path, render_file, (input_path, out_dir))
+            for input_path, out_dir in files
+        )
+
+    with contextlib.ExitStack() as stack:
+        sink = stack.enter_context(ArchiveSink(output_path))
+        if tags is not None:
+            stack.enter_context(tags)
+
+        def finish(key: str, rendered: Optional[tuple], error: str):
+            contents = pending.pop(key, None)
+            entry = None
+            if tags is not None and contents is None and rendered is not None:
+                # (rendered, catalog entry) from catalogued
+                rendered, entry = rendered
+            if rendered is not None:
+                try:
+                    sink.write(*rendered)
+                except Exception as e:
+                    logging.error(f"Failed to write {key}: {e!r}")
+                    error = repr(e)
+            summary.add(key, rendered is not None, error)
+            if tags is not None and rendered is not None and error is None:
+                output = f"{output_path}/{rendered[0]}"
+                if contents is None:
+                    tags.add_entry(key, entry, output)
+                else:
+                    tags.add_contents(key, contents, output)
+
+        run_jobs(tasks, jobs, finish)
+    if index is not None:
+        index.write_report(f"{output_path}{DUPLICATES_NAME}")
+    return summary
+
+
+FRAMINGS = ("none", "length", "ndjson")
+
+def _read_exact(stream: BinaryIO, size: int) -> Optional[bytes]:
+    """
+    :return: Exactly `size` bytes, or None on a clean end of stream before the first byte
+    """
+    data = stream.read(size)
+    if not data:
+        return None
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise EOFError(f"Stream ended inside a frame, got {len(data)} of {size} bytes")
+        data += chunk
+    return data
+
+
+def convert_record(record: dict) -> dict:
+    """
+    Converts one NDJSON record
+    :param record: {"id": optional, "bin": base64 encoded .bin dump} or {"id": optional, "nfc": .nfc file text},
+                   as decoded from JSON - anything else is answered with an error
+    :return: {"id": ..., "nfc": converted document}, or {"id": ..., "error": message} if it couldn't be converted
+    """
+    reply = {"id": record.get("id") if isinstance(record, dict) else None}
+    try:
+        if not isinstance(record, dict):
+            raise ValueError(f"Record is a JSON {type(record).__name__}, not an object")
+        if "bin" in record:
+            reply["nfc"] = convert_dump(base64.b64decode(record["bin"]))
+        elif "nfc" in record:
+            reply["nfc"] = convert_dump(record["nfc"].encode())
+        else:
+            raise ValueError("Record has neither a 'bin' nor an 'nfc' field")
+    except Exception as e:
+        logging.error(f"Failed to convert record {reply['id']}: {e!r}")
+        reply["error"] = repr(e)
+    return reply
+
+
+def convert_stream(in_stream: BinaryIO, out_stream: BinaryIO, framing: str = "none") -> int:
+    """
+    Converts dumps read from a binary stream (e.g. stdin) and writes the documents to another (e.g. stdout)
+
+    Framings:
+        none:   the whole stream is a single .bin or .nfc dump
+        length: every dump is preceded by its size as a 4-byte big-endian integer; every document is written the same
+                way. A dump that fails to convert gets an empty frame, so replies stay aligned with requests
+        ndjson: one JSON record per line, see convert_record
+    :param in_stream: Stream to read dumps from
+    :param out_stream: Stream to write converted documents to, flushed after each one
+    :param framing: One of FRAMINGS
+    :return: The number of records handled
+    """
+    count = 0
+    if framing == "none":
+        out_stream.write(convert_dump(in_stream.read()).encode())
+        count = 1
+    elif framing == "length":
+        while (header := _read_exact(in_stream, 4)) is not None:
+            size = int.from_bytes(header, "big")
+            # only a zero-length frame is empty, a stream ending right after a header was cut short
+            contents = _read_exact(in_stream, size) if size else b""
+            if contents is None:
+                raise EOFError(f"Stream ended inside a frame, got 0 of {size} bytes")
+            try:
+                document = convert_dump(contents).encode()
+            except Exception as e:
+                logging.error(f"Failed to convert frame {count}: {e!r}")
+                document = b""
+            out_stream.write(len(document).to_bytes(4, "big") + document)
+            out_stream.flush()
+            count += 1
+    elif framing == "ndjson":
+        for line in in_stream:
+            if not line.strip():
+                continue
+            try:
+                reply = convert_record(json.loads(line))
+            except ValueError as e:
+                logging.error(f"Failed to parse record {count}: {e!r}")
+                reply = {"id": None, "error": repr(e)}
+            out_stream.write(json.dumps(reply).encode() + b"\n")
+            out_stream.flush()
+            count += 1
+    else:
+        raise ValueError(f"Unknown framing {framing!r}, expected one of {FRAMINGS}")
+    out_stream.flush()
+    logging.debug(f"Converted {count} records from stream")
+    return count
+
+
+def report_stats(destination: Optional[str]):
+    """
+    Emits the active RunStats as JSON
+    :param destination: A file to write to, "-" for stderr, or None if stats weren't requested
+    """
+    if _stats is None or not destination:
+        return
+    report = json.dumps(_stats.to_dict(), indent=2)
+    if destination == "-":
+        # stdout may carry converted documents, the report goes to stderr
+        print(report, file=sys.stderr)
+    else:
+        with atomic_open(destination) as f:
+            f.write(report)
+
+
+class ServerMetrics:
+    """
+    Request counts and latencies of a conversion server
+    """
+
+    def __init__(self, window: int = 4096):
+        """
+        :param window: How many of the most recent request latencies the percentiles are computed over
+        """
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.latencies = collections.deque(maxlen=window)
+
+    @contextlib.contextmanager
+    def request(self):
+        """
+        Tracks one request; yields a dict whose "error" key the caller sets if the request failed
+        """
+        outcome = {"error": False}
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            yield outcome
+        finally:
+            latency = time.perf_counter() - started
+            with self.lock:
+                self.in_flight -= 1
+                self.requests += 1
+                self.errors += bool(outcome["error"])
+                self.latencies.append(latency)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                "uptime_s": time.perf_counter() - self.started,
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+        for name, p in (("p50_ms", 0.50), ("p90_ms", 0.90), ("p99_ms", 0.99)):
+            snapshot[name] = latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else None
+        snapshot["max_ms"] = latencies[-1] * 1000 if latencies else None
+        return snapshot
+
+
+class ConversionRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks the NDJSON protocol of convert_record over a connection, one reply line per request line.
+    {"id": ..., "op": "metrics"} is answered with {"id": ..., "metrics": ServerMetrics.snapshot()}
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                reply = {"id": None, "error": repr(e)}
+            else:
+                if not isinstance(record, dict):
+                    reply = {"id": None, "error": f"Request is a JSON {type(record).__name__}, not an object"}
+                elif record.get("op") == "metrics":
+                    reply = {"id": record.get("id"), "metrics": self.server.metrics.snapshot()}
+                else:
+                    with self.server.limit, self.server.metrics.request() as outcome:
+                        reply = convert_record(record)
+                        outcome["error"] = "error" in reply
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+def parse_address(address: str):
+    """
+    :param address: A Unix socket path, or PORT / HOST:PORT for TCP
+    :return: A TCP (host, port) tuple, or the socket path
+    """
+    if address.isdigit():
+        return "127.0.0.1", int(address)
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address and os.sep not in address:
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def make_server(address: str, concurrency: int = 8) -> socketserver.BaseServer:
+    """
+    Creates a conversion server, handling every connection in its own thread
+    :param address: A Unix socket path, or PORT / HOST:PORT for TCP (localhost unless a host is given)
+    :param concurrency: Maximum number of conversions running at once, across all connections
+    :return: The server, ready for serve_forever()
+    """
+    parsed = parse_address(address)
+    if isinstance(parsed, tuple):
+        server = socketserver.ThreadingTCPServer(parsed, ConversionRequestHandler)
+    else:
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            raise ValueError(f"Unix sockets aren't available here, pass a port instead of {address}")
+        try:
+            mode = os.lstat(parsed).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{parsed} already exists and isn't a socket, refusing to replace it")
+            # a stale socket from a previous run would make bind() fail
+            os.unlink(parsed)
+        server = socketserver.ThreadingUnixStreamServer(parsed, ConversionRequestHandler)
+    server.daemon_threads = True
+    server.metrics = ServerMetrics()
+    server.limit = threading.BoundedSemaphore(concurrency)
+    return server
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(address: str, concurrency: int = 8):
+    """
+    Keeps the converter resident and answers conversion requests until interrupted (Ctrl+C or SIGTERM)
+    :param address: A Unix socket path, or PORT / HOST:PORT for TCP
+    :param concurrency: Maximum number of conversions running at once
+    """
+    server = make_server(address, concurrency)
+    signal.signal(signal.SIGTERM, _interrupt)
+    logging.info(f"Serving conversions on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not isinstance(server.server_address, tuple):
+            os.unlink(server.server_address)
+        logging.info(f"Server metrics: {json.dumps(server.metrics.snapshot())}")
+
+
+class Inotify:
+    """
+    Minimal Linux inotify binding, used by watch mode to wake up as soon as something changes in a watched directory
+    instead of sleeping for the whole polling interval
+    """
+
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x00000002 | 0x00000008 | 0x00000080 | 0x00000100 | 0x00000200
+    # IN_NONBLOCK | IN_CLOEXEC
+    FLAGS = 0o4000 | 0o2000000
+
+    def __init__(self, libc: ctypes.CDLL, fd: int):
+        self.libc = libc
+        self.fd = fd
+        self.watched: Set[str] = set()
+
+    @classmethod
+    def create(cls) -> Optional["Inotify"]:
+        """
+        :return: An Inotify instance, or None where inotify isn't available
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(cls.FLAGS)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def watch(self, directories: Iterable[str]):
+        for directory in directories:
+            if directory not in self.watched:
+                if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) >= 0:
+                    self.watched.add(directory)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Blocks until a watched directory changes or the timeout runs out
+        :return: True if there were events
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # the events themselves don't matter, the next snapshot finds out what changed
+        with contextlib.suppress(BlockingIOError):
+            while os.read(self.fd, 65536):
+                pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_snapshot(path: str, output_path: str, tree: bool) -> Tuple[Dict[str, Tuple[Tuple[int, int], str]], Set[str]]:
+    """
+    Lists every file watch mode would convert, with a fingerprint to detect changes
+    :return: ({input path: ((size, mtime_ns), output directory)}, directories the files are in)
+    """
+    files = {}
+    directories = {str(path)}
+    # iter_files leaves out an output folder nested inside the input folder; its files are ours, not new dumps
+    for input_path, out_dir in iter_files(path, output_path, tree):
+        if get_output_name(os.path.split(input_path)[1]) is None:
+            continue
+        try:
+            stat = os.stat(input_path)
+        except FileNotFoundError:
+            continue
+        files[input_path] = ((stat.st_size, stat.st_mtime_ns), out_dir)
+        directories.add(os.path.dirname(input_path))
+    return files, directories
+
+
+def watch(
+    path: str,
+    output_path: str,
+    tree: bool,
+    jobs: int = 1,
+    interval: float = 2.0,
+    settle: float = 2.0,
+    catalog: str = None,
+    **options,
+):
+    """
+    Converts everything once with process(), then keeps running and converts files as they are added or modified.
+
+    Changes are found by comparing snapshots of the tree. Where inotify is available the next snapshot is taken as
+    soon as something changes, otherwise every `interval` seconds. A file is only converted once it hasn't been
+    written to for `settle` seconds, so files still being copied in aren't converted half-written.
+    :param path: The directory to watch
+    :param output_path: The base directory to output to
+    :param tree: Keep the same folder structure from the input folder to the output folder
+    :param jobs: Number of worker processes
+    :param interval: Seconds between snapshots when nothing wakes the watcher up earlier
+    :param settle: Seconds a file must stay unmodified before it is converted
+    :param catalog: SQLite database to record every converted tag in, see Catalog
+    :param options: Further process() options for the initial run, e.g. incremental
+    """
+    # snapshot before the initial run, so dumps arriving while it walks the tree are picked up afterwards
+    files, directories = watch_snapshot(path, output_path, tree)
+    # input path -> fingerprint it had when it was last converted (or failed to convert)
+    seen = {input_path: fingerprint for input_path, (fingerprint, _) in files.items()}
+    summary = process(path, output_path, tree, jobs, catalog=catalog, **options)
+    _durability.sync()
+    print(summary.report())
+    for input_path, (_, out_dir) in files.items():
+        # files converted in place were modified by the initial run itself, that's not a change
+        if get_output_file(input_path, out_dir) == input_path:
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.stat(input_path)
+                seen[input_path] = (stat.st_size, stat.st_mtime_ns)
+    waiting = False
+
+    notifier = Inotify.create()
+    tags = Catalog(catalog) if catalog is not None else None
+    logging.info(f"Watching {path} for new dumps{' with inotify' if notifier else ''}")
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        while True:
+            timeout = min(interval, settle) if waiting else interval
+            if notifier is not None:
+                notifier.watch(directories)
+                notifier.wait(timeout)
+            else:
+                time.sleep(timeout)
+
+            files, directories = watch_snapshot(path, output_path, tree)
+            for input_path in seen.keys() - files.keys():
+                del seen[input_path]
+
+            now = time.time_ns()
+            ready = []
+            waiting = False
+            for input_path, (fingerprint, out_dir) in files.items():
+                if seen.get(input_path) == fingerprint:
+                    continue
+                if now - fingerprint[1] < settle * 1e9:
+                    logging.debug(f"{input_path} was modified recently, waiting for it to settle")
+                    waiting = True
+                    continue
+                ready.append((input_path, out_dir))
+            if not ready:
+                continue
+
+            summary = RunSummary()
+
+            def finish(input_path: str, converted, error: str):
+                entry = None
+                if isinstance(converted, tuple):
+                    # (converted, catalog entry) from catalogued
+                    converted, entry = converted
+                summary.add(input_path, converted, error)
+                # remember the file as it is now, so an in-place conversion doesn't count as a change
+                with contextlib.suppress(FileNotFoundError):
+                    stat = os.stat(input_path)
+                    seen[input_path] = (stat.st_size, stat.st_mtime_ns)
+                if tags is not None and converted and error is None:
+                    tags.add_entry(input_path, entry, outputs[input_path])
+
+            outputs = {input_path: get_output_file(input_path, out_dir) for input_path, out_dir in ready}
+            tasks = (
+                (input_path, catalogued, (convert_file, input_path, out_dir))
+                if tags is not None
+                else (input_path, convert_file, (input_path, out_dir))
+                for input_path, out_dir in ready
+            )
+            run_jobs(tasks, jobs, finish)
+            _durability.sync()
+            if tags is not None:
+                tags.commit()
+            print(summary.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if notifier is not None:
+            notifier.close()
+        if tags is not None:
+            tags.close()
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input-path",
+        type=pathlib.Path,
+        help="Single file, .zip/.tar archive or directory tree to convert. "
+        "Pass - to read from stdin and write to stdout.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-path",
+        required=False,
+        type=pathlib.Path,
+        help="Directory to store output in. Will be created if it doesn't exist. If not specified, the output will be "
+        "stored in the same location as the original, with a '.nfc' extension. Pass a path ending in .zip or .tar "
+        "(optionally .gz/.bz2/.xz) to write everything into a single archive instead.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Show extra info: pass -v to see what's going on, pass -vv to get useful debug info.",
+    )
+    parser.add_argument(
+        "-t",
+        "--tree",
+        action="store_true",
+        default=False,
+        help="Keep the same folder structure from the input folder to the output folder.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        nargs="?",
+        type=int,
+        default=1,
+        const=os.cpu_count() or 1,
+        help="Convert files in parallel with N worker processes. Pass -j without a number to use one per CPU.",
+    )
+    parser.add_argument(
+        "--pipeline",
+        nargs="?",
+        type=int,
+        default=0,
+        const=8,
+        metavar="THREADS",
+        help="Overlap reading, converting and writing files, with THREADS reader and THREADS writer threads "
+        "(8 if not given). Meant for network filesystems; used instead of --jobs.",
+    )
+    parser.add_argument(
+        "--record-size",
+        type=int,
+        default=0,
+        help="Treat every input file as a container of concatenated fixed-size dumps (e.g. 540 or 572 bytes each) "
+        "and convert each record into its own .nfc file, named after the container and the record number.",
+    )
+    parser.add_argument(
+        "--record-offset",
+        type=int,
+        default=0,
+        help="With --record-size, bytes to skip at the start of each container before the first record.",
+    )
+    parser.add_argument(
+        "--record-glob",
+        nargs="+",
+        default=list(RECORD_GLOBS),
+        metavar="PATTERN",
+        help="With --record-size and an input folder, only files matching one of these patterns are containers "
+        f"(default: {' '.join(RECORD_GLOBS)}).",
+    )
+    parser.add_argument(
+        "--duplicates",
+        choices=DUPLICATE_POLICIES,
+        default="all",
+        help="What to do with files holding a UID already seen in this run: convert them all (all), only convert the "
+        f"first one (first), or convert them all and list them (report). first and report list the duplicates in "
+        f"{DUPLICATES_NAME} in the output folder.",
+    )
+    parser.add_argument(
+        "--catalog",
+        metavar="DB",
+        help="Record every converted tag's UID, PWD, PACK, source file, content hash and output file in this SQLite "
+        "database.",
+    )
+    parser.add_argument(
+        "--lookup",
+        metavar="HEX",
+        help="Instead of converting, print every tag in --catalog with this UID (7 bytes) or PWD (4 bytes).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help=f"Only convert files that changed since the last run, tracked in {MANIFEST_NAME} in the output folder.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="With --incremental, convert every file regardless of the manifest and rebuild it.",
+    )
+    parser.add_argument(
+        "--durability",
+        choices=DURABILITY_MODES,
+        default="none",
+        help="Every output is written to a temporary file and renamed into place, so a crash never leaves a truncated "
+        "file. On top of that: leave flushing to disk to the OS (none), fsync every --sync-every files at once "
+        "(batch), or fsync every file as it is written (fsync).",
+    )
+    parser.add_argument(
+        "--sync-every",
+        type=int,
+        default=1000,
+        metavar="N",
+        help="With --durability batch, how many files to write between fsyncs.",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Keep every converted document in this content-addressed cache, keyed by a hash of the input, so "
+        "identical dumps (e.g. copies under other names, or from earlier runs) are only converted once.",
+    )
+    parser.add_argument(
+        "--cache-memory",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="With --cache, how many MB of recently used documents to also keep in memory (per worker process).",
+    )
+    parser.add_argument(
+        "--cache-copy",
+        action="store_true",
+        default=False,
+        help="With --cache, always write cache hits as copies instead of hard links to the cache.",
+    )
+    parser.add_argument(
+        "--framing",
+        choices=FRAMINGS,
+        default="none",
+        help="How dumps are delimited with -i -: a single dump (none), 4-byte big-endian length prefixes (length), "
+        "or one JSON record per line (ndjson).",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="After converting the input folder, keep running and convert files as they are added or modified.",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=2.0,
+        help="With --watch, seconds between checks for changes (inotify wakes it up earlier where available).",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="With --watch, seconds a file must stay unmodified before it is converted.",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="Run as a conversion server instead of converting --input-path. ADDRESS is a Unix socket path, or "
+        "PORT / HOST:PORT for TCP. Requests and replies are NDJSON records like --framing ndjson; "
+        '{"op": "metrics"} returns request counts and latency percentiles.',
+    )
+    parser.add_argument(
+        "--serve-concurrency",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="With --serve, the maximum number of conversions running at once.",
+    )
+    parser.add_argument(
+        "--stats",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Time every stage (walk, read, convert, assemble, write) and report wall/CPU time, calls and bytes per "
+        "stage as JSON at the end of the run. Printed to stderr, or written to FILE if given.",
+    )
+    args = parser.parse_args()
+    if args.lookup is not None and args.catalog is None:
+        parser.error("--lookup needs a --catalog to look in")
+    if args.input_path is None and args.serve is None and args.lookup is None:
+        parser.error("the following arguments are required: -i/--input-path")
+    if args.duplicates != "all" and (args.watch or args.record_size):
+        parser.error("--duplicates only applies to one-off runs over files and archives, not --watch or --record-size")
+    if args.watch and args.output_path and is_archive(args.output_path):
+        parser.error("--watch can't add to an output archive, use an output folder")
+    if args.record_size and args.watch:
+        parser.error("--record-size containers can't be watched, convert them without --watch")
+    if args.record_size and args.catalog:
+        parser.error("--record-size records can't be added to a --catalog")
+    if args.record_size and args.output_path and is_archive(args.output_path):
+        parser.error("--record-size output can't be written into an archive, use an output folder")
+    if args.record_size < 0 or args.record_offset < 0:
+        parser.error("--record-size and --record-offset can't be negative")
+    if args.cache_memory < 0:
+        parser.error("--cache-memory can't be negative")
+    if args.sync_every < 1:
+        parser.error("--sync-every must be at least 1")
+    if args.verbose >= 2:
+        # set debug
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbose >= 1:
+        # set info
+        logging.basicConfig(level=logging.INFO)
+    logging.debug(f"Parsed args into {args}")
+    return args
+
+
+def main():
+    args = get_args()
+    if args.stats:
+        set_stats(RunStats())
+    set_durability(Durability(args.durability, args.sync_every))
+    if args.cache:
+        set_cache(OutputCache(args.cache, args.cache_memory << 20, not args.cache_copy))
+
+    if args.serve:
+        try:
+            serve(args.serve, args.serve_concurrency)
+        except (FileExistsError, ValueError) as e:
+            logging.error(e)
+        return
+
+    if args.lookup is not None:
+        with Catalog(args.catalog) as catalog:
+            try:
+                for row in catalog.lookup(args.lookup):
+                    print(json.dumps(row))
+            except ValueError as e:
+                logging.error(e)
+        return
+
+    # streaming mode, stdout only carries converted documents
+    if str(args.input_path) == "-":
+        convert_stream(sys.stdin.buffer, sys.stdout.buffer, args.framing)
+        report_stats(args.stats)
+        return
+
+    # single file mode
+    if os.path.isfile(args.input_path):
+        if not args.output_path:
+            args.output_path = os.path.split(args.input_path)[0]
+    # recursive directory mode
+    elif os.path.isdir(args.input_path):
+        if not args.output_path:
+            logging.exception(
+                ValueError(
+                    f"{args.input_path} is a directory, but no output path given."
+                )
+            )
+        # an output archive is created, along with its directory, once the run starts
+        if not is_archive(args.output_path):
+            logging.debug(f"Going to create output directory {args.output_path}")
+            os.makedirs(args.output_path, exist_ok=True)
+    elif not os.path.exists(args.input_path):
+        logging.exception(
+            FileNotFoundError(f"{args.input_path} doesn't actually exist")
+        )
+
+    logging.debug(f"input: {args.input_path}, output: {args.output_path}")
+    if args.watch:
+        watch(
+            args.input_path,
+            args.output_path,
+            args.tree,
+            args.jobs,
+            args.watch_interval,
+            args.settle,
+            incremental=args.incremental,
+            force=args.force,
+            pipeline=args.pipeline,
+            catalog=args.catalog,
+        )
+        return
+
+    summary = process(
+        args.input_path,
+        args.output_path,
+        args.tree,
+        args.jobs,
+        args.incremental,
+        args.force,
+        args.pipeline,
+        args.record_size,
+        args.record_offset,
+        args.duplicates,
+        args.catalog,
+        args.record_glob,
+    )
+    _durability.sync()
+    print(summary.report())
+    report_stats(args.stats)
+    print("----Good Execution----")
 
 
 if __name__ == "__main__":
     main()
-    print("----Good Execution----")
\ No newline at end of file